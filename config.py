@@ -8,4 +8,17 @@ PRIORITY_ORDER = [
     "demohub"
 ]
 
-ECR_ROOT = "tgk-cdc/"
\ No newline at end of file
+ECR_ROOT = "tgk-cdc/"
+
+# Registry interrogati in parallelo per le versioni delle immagini.
+# type: "ecr" (ACR previsto in futuro); account: registryId ECR (None = account del profilo)
+REGISTRIES = [
+    {"name": "ecr-eu-central-1", "type": "ecr", "profile": "saml", "region": "eu-central-1", "account": None, "prefix": ECR_ROOT},
+]
+
+# values.yaml/Chart.yaml scaricati senza clonare il repo chart, uno per versione
+CHART_CACHE_DIR = ".cdc_config/chart_cache"
+
+# Object store condiviso (repo bare) usato come --reference dai clone: i repo fratelli
+# (config-dev/prod, varianti -az) non duplicano gli oggetti comuni. None = clone indipendenti
+OBJECT_CACHE_DIR = ".cdc_config/object_cache.git"
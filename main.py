@@ -3,23 +3,35 @@ import pandas as pd
 import os
 import json
 import time
-from config import PRIORITY_ORDER
+from config import PRIORITY_ORDER, CHART_CACHE_DIR
 # Assicurati che check_app_updates sia stato aggiunto a git_manager
-from modules.git_manager import git_pull_all, git_commit_push, get_git_diff, git_clone_from_file, git_update_self, git_hard_reset, git_clone_related_chart, check_app_updates
-from modules.data_loader import load_data
+from modules.git_manager import fetch_chart_values, git_commit_push, get_git_diff, git_clone_from_file, git_update_self, git_hard_reset, git_clone_related_chart, check_app_updates
+from modules.data_loader import get_cached_data, get_scan_progress, refresh_in_background
+from modules.snapshot import load_snapshot
 # Assicurati che is_valid_yaml sia stato aggiunto a yaml_manager
 from modules.yaml_manager import get_file_content, save_file_content, get_chart_values_content, generate_completions_from_yaml, is_valid_yaml
 # Assicurati che is_valid_terraform sia stato aggiunto a terraform_manager
 from modules.terraform_manager import get_tf_version, is_valid_terraform
-from modules.ecr_manager import get_ecr_versions
-from modules.ui import inject_table_css
+from modules.ecr_manager import get_ecr_versions_cached, check_image_tags_exist, image_refs_from_overlay, ecr_repository_for_image
+from modules.ui import inject_table_css, build_matrix_html
+from modules.scheduler import get_scheduler, DEFAULT_REFRESH_INTERVAL
+from modules.shared_cache import get_shared_cache
+from modules.git_jobs import get_job_queue
+from modules.version_index import get_version_index
+from modules.kustomize_validator import validate_envs, touched_envs
+from modules.chart_validator import validate_all, validate_base_file
+from modules.promotion import build_promotion_plan, apply_promotion_plan, DEFAULT_SELECTED_KINDS
+from modules.profiler import RerunProfiler, profiling_requested, hot_functions, stats_bytes
+from modules.api_server import get_api_server
 from code_editor import code_editor
 
 # --- 1. CONFIGURAZIONE PAGINA RINOMINATA ---
 st.set_page_config(page_title="CDC Version Manager", layout="wide")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-SETTINGS_FILE = os.path.join(BASE_DIR, ".cdc_config", "settings.json")
+# CDC_CONFIG_DIR permette di isolare i settings (es. tools/load_test.py)
+CONFIG_DIR = os.environ.get("CDC_CONFIG_DIR", os.path.join(BASE_DIR, ".cdc_config"))
+SETTINGS_FILE = os.path.join(CONFIG_DIR, "settings.json")
 PROJECTS_FILE = os.path.join(BASE_DIR, "progetti.txt")
 
 # --- FUNZIONI DI UTILITÀ (SETTINGS) ---
@@ -35,9 +47,8 @@ def update_settings(new_data):
     except Exception as e: print(f"Errore settings: {e}")
 
 def load_settings():
-    conf_dir = os.path.join(BASE_DIR, ".cdc_config")
-    if not os.path.exists(conf_dir):
-        os.makedirs(conf_dir, exist_ok=True)
+    if not os.path.exists(CONFIG_DIR):
+        os.makedirs(CONFIG_DIR, exist_ok=True)
 
     if os.path.exists(SETTINGS_FILE):
         try:
@@ -48,12 +59,23 @@ def load_settings():
 def reset_settings():
     if os.path.exists(SETTINGS_FILE): os.remove(SETTINGS_FILE)
     if 'root_dir' in st.session_state: del st.session_state['root_dir']
-    if 'init' in st.session_state: del st.session_state['init']
     st.rerun()
 
 app_settings = load_settings()
 root_dir_setting = app_settings.get("root_dir")
 
+# --- PROFILING DEL RERUN (?profile=1 oppure "profile_reruns": true nei settings) ---
+# Un rerun interrotto (st.rerun/st.stop, nuova interazione) non arriva al fondo: il suo profiler resta attivo
+leaked_profiler = st.session_state.pop('rerun_profiler', None)
+if leaked_profiler: leaked_profiler.stop()
+rerun_profiler = None
+if profiling_requested(st.query_params, app_settings):
+    rerun_profiler = RerunProfiler()
+    if rerun_profiler.start(): st.session_state['rerun_profiler'] = rerun_profiler
+    else:
+        st.sidebar.warning("⏱️ Profiling non disponibile: un altro profiler è già attivo nel processo (es. un'altra sessione).")
+        rerun_profiler = None
+
 # --- WIZARD CONFIGURAZIONE INIZIALE ---
 if 'root_dir' not in st.session_state:
     if root_dir_setting and os.path.exists(root_dir_setting):
@@ -88,58 +110,153 @@ if 'root_dir' not in st.session_state:
 ROOT_DIR = st.session_state['root_dir']
 inject_table_css()
 
-# --- 2. INIZIALIZZAZIONE (PULL & UPDATE CHECK) ---
-if 'init' not in st.session_state:
-    with st.spinner("🔄 Inizializzazione: Pull progetti e check aggiornamenti App..."):
-        # Esegue pull parallelo e salva lo stato (Successo/Fallimento)
-        st.session_state['pull_status'] = git_pull_all(ROOT_DIR)
-        
-        # Controlla se ci sono aggiornamenti dell'app stessa
-        st.session_state['app_update_available'] = check_app_updates(BASE_DIR)
-        
-    st.session_state['init'] = True
+# --- 2. REFRESH IN BACKGROUND (PULL & UPDATE CHECK) ---
+# Lo scheduler vive fuori dal ciclo di rerun: la pagina parte subito dagli ultimi dati noti
+scheduler = get_scheduler(ROOT_DIR, BASE_DIR)
+scheduler.set_interval(app_settings.get("refresh_interval", DEFAULT_REFRESH_INTERVAL))
+shared_cache = get_shared_cache()
+sched_state = scheduler.snapshot()
+
+# --- ENDPOINT JSON READ-ONLY (opzionale): stessa scansione condivisa e stesso stato di sync ---
+api_port = os.environ.get("CDC_API_PORT") or app_settings.get("api_port")
+if api_port:
+    try: get_api_server(ROOT_DIR, int(api_port), scheduler.snapshot)
+    except OSError as e: st.sidebar.caption(f"❌ API non avviata sulla porta {api_port}: {e}")
+
+def data_generation():
+    # Cambia quando arriva un pull con novità o quando una qualsiasi sessione invalida la cache
+    return (scheduler.snapshot()['generation'], shared_cache.generation)
+
+def invalidate_data():
+    shared_cache.invalidate(f"scan:{ROOT_DIR}")
+
+# --- CODA JOB GIT: seriale per repo, parallela tra repo, non blocca la UI ---
+job_queue = get_job_queue()
+
+def submit_git_job(repo_path, label, fn, *args, row_key=None, on_done=None):
+    def done(job, root=ROOT_DIR):
+        # A job concluso tutte le sessioni rileggono i dati
+        shared_cache.invalidate(f"scan:{root}")
+        if on_done: on_done(job)
+    job_id = job_queue.submit(repo_path, label, fn, *args, on_done=done)
+    if row_key: st.session_state.setdefault('row_jobs', {})[row_key] = job_id
+    st.toast(f"{label}: in coda", icon="🕒")
+    return job_id
+
+def show_row_job(row_key):
+    job_id = st.session_state.get('row_jobs', {}).get(row_key)
+    job = job_queue.get(job_id) if job_id else None
+    if not job: return
+    if job['status'] == "queued": st.info(f"🕒 {job['label']}: in coda")
+    elif job['status'] == "running": st.info(f"⏳ {job['label']}: in corso...")
+    elif job['ok']: st.success(f"{job['label']}: {job['message']}")
+    else: st.error(f"{job['label']}: {job['message']}")
+
+@st.fragment(run_every=3)
+def render_git_jobs():
+    active, history = job_queue.active(), job_queue.history()[:10]
+    with st.expander(f"⚙️ Job Git ({len(active)} attivi)", expanded=bool(active)):
+        for j in active:
+            state = "⏳ in corso" if j['status'] == "running" else f"🕒 in coda (#{j['position']})"
+            st.caption(f"{state} · {j['repo']}: {j['label']}")
+        for j in history:
+            elapsed = (j['finished_at'] or 0) - (j['started_at'] or j['finished_at'] or 0)
+            st.caption(f"{'✅' if j['ok'] else '❌'} {j['repo']}: {j['label']} ({elapsed:.1f}s)", help=j['message'] or None)
+        if not active and not history: st.caption("Nessun job")
+
+# Un rerun completo mostra sempre i dati più recenti
+st.session_state['seen_generation'] = data_generation()
 
 # --- HEADER E BOTTONI ---
 col1, col2 = st.columns([2, 1])
 with col1: st.title("📦 CDC Version Manager")
-with col2:
-    b1, b2, b3 = st.columns([1, 1, 0.5])
-    
-    # Bottone Force Pull
-    if b1.button("🔄 Pull All"): 
-        st.session_state.pop('init', None)
+
+@st.fragment(run_every=10)
+def render_header_controls():
+    state = scheduler.snapshot()
+    # Nuovi risultati (pull o modifiche da altre sessioni): rerun completo solo se i dati sono cambiati
+    if data_generation() != st.session_state.get('seen_generation'):
+        st.rerun()
+    # Stiamo mostrando lo snapshot e la scansione vera è pronta
+    if st.session_state.get('using_snapshot') and shared_cache.get(f"scan:{ROOT_DIR}") is not None:
         st.rerun()
 
+    b1, b2, b3 = st.columns([1, 1, 0.5])
+
+    # Bottone Force Pull (non bloccante)
+    if b1.button("🔄 Pull All", help="In corso..." if state['running'] else None):
+        scheduler.trigger()
+        st.toast("Pull avviato in background", icon="🔄")
+
     # --- 4. BOTTONE AGGIORNAMENTO APP DINAMICO ---
-    has_update = st.session_state.get('app_update_available', False)
+    has_update = state['app_update_available']
     btn_label = "⬇️ Aggiorna!" if has_update else "✅ App OK"
     btn_type = "primary" if has_update else "secondary"
     help_txt = "Nuova versione disponibile!" if has_update else "Nessun aggiornamento rilevato"
 
     if b2.button(btn_label, type=btn_type, help=help_txt):
-        with st.spinner("Scarico aggiornamento applicazione..."):
-            ok, msg = git_update_self(BASE_DIR)
-            st.toast(msg, icon="✅" if ok else "❌")
-            if ok and "scaricato" in msg:
-                time.sleep(1)
-                st.rerun()
-            else:
-                # Se fallisce o era già pari, ricontrolla
-                st.session_state['app_update_available'] = check_app_updates(BASE_DIR)
-                st.rerun()
-                
+        # A fine job ricontrolla (se fallisce o era già pari il bottone torna coerente)
+        submit_git_job(BASE_DIR, "Aggiornamento app", git_update_self, BASE_DIR,
+                       on_done=lambda job: scheduler.set_app_update_available(check_app_updates(BASE_DIR)))
+
     # Bottone Reset Settings
     if b3.button("⚙️"): reset_settings()
 
-df = load_data(ROOT_DIR)
+    if state['running']: st.caption("🔄 Sync in corso...")
+    elif state['last_run']:
+        counts = state['sync_counts']
+        st.caption(f"🕒 Ultimo sync: {time.strftime('%H:%M:%S', time.localtime(state['last_run']))} · "
+                   f"⬇️ {counts['pulled']} aggiornati · ⏭️ {counts['skipped']} già allineati · ❌ {counts['failed']} falliti")
+    if state['last_error']: st.caption(f"❌ {state['last_error']}")
+
+with col2: render_header_controls()
+
+# --- CARICAMENTO PROGRESSIVO: con cache fredda la matrice si riempie repo per repo ---
+progress_slot = st.empty()
+
+def show_partial_matrix(partial_df, pending):
+    with progress_slot.container():
+        st.caption(f"⏳ Scansione in corso: {len(pending)} repo in attesa")
+        if pending:
+            st.markdown(" ".join(f"`{name}`" for name in pending))
+        failed_repos = [r for r, ok in sched_state['pull_status'].items() if not ok]
+        st.markdown(build_matrix_html(partial_df, failed_repos), unsafe_allow_html=True)
+
+# --- WARM START: all'avvio della sessione, con cache fredda, si parte dallo snapshot su disco ---
+df = shared_cache.get(f"scan:{ROOT_DIR}")
+snapshot_age = None
+if df is None and not st.session_state.get('has_fresh_data'):
+    snap_df, snap_meta = load_snapshot(ROOT_DIR)
+    if snap_df is not None:
+        df = snap_df
+        snapshot_age = max(0, time.time() - snap_meta['saved_at'])
+        refresh_in_background(ROOT_DIR)
+
+def wait_for_scan():
+    """La scansione gira headless in background: la pagina ne mostra i parziali finché non è conclusa."""
+    refresh_in_background(ROOT_DIR)
+    shown = None
+    while shared_cache.is_inflight(f"scan:{ROOT_DIR}"):
+        progress = get_scan_progress(ROOT_DIR)
+        if progress is not None and progress is not shown:
+            show_partial_matrix(*progress)
+            shown = progress
+        time.sleep(0.3)
+    # Risultato in cache; se è stato scartato da un'invalidazione o la scansione è fallita si ripete qui
+    return get_cached_data(ROOT_DIR)
+
+if df is None:
+    df = wait_for_scan()
+    progress_slot.empty()
+
+st.session_state['using_snapshot'] = snapshot_age is not None
+if snapshot_age is None: st.session_state['has_fresh_data'] = True
+else:
+    age_txt = f"{int(snapshot_age // 60)} min" if snapshot_age >= 60 else f"{int(snapshot_age)} s"
+    st.info(f"📦 Dati dallo snapshot di {age_txt} fa: aggiornamento in corso...")
 
 # --- FILTRI E SIDEBAR ---
-if not df.empty:
-    repo_s = df['RepoFolder'].astype(str).str.strip().str.lower()
-    env_s = df['Ambiente'].astype(str).str.strip().str.lower()
-    mask_azure = repo_s.str.endswith('-az') | repo_s.str.contains('-az-') | env_s.str.endswith('-az')
-else:
-    mask_azure = pd.Series([False]*len(df))
+mask_azure = df['Cloud'] == "azure"
 
 st.sidebar.title("🛠️ Contesto")
 last_provider = app_settings.get("last_provider", "☁️ AWS")
@@ -150,9 +267,7 @@ prov_options = ["☁️ AWS", "🔷 Azure"]
 prov_idx = prov_options.index(last_provider) if last_provider in prov_options else 0
 cloud_filter = st.sidebar.radio("Provider", prov_options, index=prov_idx, horizontal=True)
 
-df_sidebar = pd.DataFrame()
-if not df.empty:
-    df_sidebar = df[~mask_azure] if cloud_filter == "☁️ AWS" else df[mask_azure]
+df_sidebar = df[~mask_azure] if cloud_filter == "☁️ AWS" else df[mask_azure]
 
 sel_proj = None
 sel_env_display = None
@@ -165,12 +280,10 @@ if not df_sidebar.empty:
     sel_proj = st.sidebar.selectbox("Progetto", proj_opts, index=proj_idx)
     
     if sel_proj:
-        raw_envs = sorted(df_sidebar[df_sidebar['Progetto'] == sel_proj]['Ambiente'].unique())
+        proj_envs = df_sidebar.loc[df_sidebar['Progetto'] == sel_proj, ['BaseEnv', 'Ambiente']].drop_duplicates()
         env_map = {}
-        for r_env in raw_envs:
-            c_env = r_env[:-3] if r_env.endswith('-az') else r_env
-            if c_env not in env_map: env_map[c_env] = []
-            env_map[c_env].append(r_env)
+        for c_env, r_env in sorted(zip(proj_envs['BaseEnv'], proj_envs['Ambiente'])):
+            env_map.setdefault(c_env, []).append(r_env)
             
         env_opts = sorted(env_map.keys())
         env_idx = 0
@@ -186,78 +299,112 @@ if changes_to_save:
     update_settings(changes_to_save)
     app_settings.update(changes_to_save)
 
+# --- RICERCA VERSIONI (indice invertito sulla matrice) ---
+version_query = st.sidebar.text_input("🔎 Cerca versione", placeholder="1.4.2 · 1.4* · 0.9.x · >=1.2 <2.0",
+                                      help="Esatta, per prefisso (*) o range semver (x, ^, ~, >=, <)")
+search_hits = get_version_index(ROOT_DIR, df).search(version_query) if version_query else []
+# Celle da evidenziare: (cloud, progetto, ambiente come mostrato nella tabella)
+matched_cells = {(h['Cloud'], h['Progetto'], h['BaseEnv'] if h['Cloud'] == "azure" else h['Ambiente']) for h in search_hits}
+if version_query:
+    if search_hits:
+        st.sidebar.caption(f"{len(search_hits)} occorrenze in {len(matched_cells)} celle")
+        st.sidebar.dataframe(pd.DataFrame(search_hits)[["Progetto", "Ambiente", "Campo", "Valore", "File"]],
+                             hide_index=True, use_container_width=True)
+    else:
+        st.sidebar.caption("Nessuna occorrenza")
+
+with st.sidebar: render_git_jobs()
+
+with st.sidebar.expander("🕒 Sync repository"):
+    new_interval = st.number_input("Intervallo refresh (s)", min_value=30, step=30,
+                                   value=int(app_settings.get("refresh_interval", DEFAULT_REFRESH_INTERVAL)))
+    if new_interval != app_settings.get("refresh_interval", DEFAULT_REFRESH_INTERVAL):
+        update_settings({"refresh_interval": int(new_interval)})
+        app_settings["refresh_interval"] = int(new_interval)
+        scheduler.set_interval(new_interval)
+    last_synced = sched_state['last_synced']
+    if last_synced:
+        st.dataframe(pd.DataFrame([
+            {"Repo": r, "Ultimo sync": time.strftime('%d/%m %H:%M:%S', time.localtime(ts))}
+            for r, ts in sorted(last_synced.items())
+        ]), hide_index=True, use_container_width=True)
+    else:
+        st.caption("Primo sync in corso...")
+
+# --- VALIDAZIONE valuesInline CONTRO IL values.yaml DEL CHART (tutti gli ambienti in un passaggio) ---
+schema_issues = validate_all(ROOT_DIR, df)
+schema_cells = set()
+if schema_issues:
+    bad_rows = df[[k in schema_issues for k in zip(df['RepoFolder'], df['Ambiente'])]]
+    # Come per la ricerca: per Azure la cella mostrata è quella del BaseEnv
+    schema_cells = {(c, p, b if c == "azure" else e) for c, p, e, b in
+                    zip(bad_rows['Cloud'], bad_rows['Progetto'], bad_rows['Ambiente'], bad_rows['BaseEnv'])}
+
 if not df.empty:
-    df_aws = df[~mask_azure].copy()
-    df_az = df[mask_azure].copy()
-    if not df_az.empty: df_az['Ambiente'] = df_az['Ambiente'].apply(lambda x: x[:-3] if str(x).endswith('-az') else x)
+    df_aws = df[~mask_azure]
+    df_az = df[mask_azure].assign(Ambiente=df.loc[mask_azure, 'BaseEnv'])
 
     # --- 3. RENDER TABLE AGGIORNATO (ICONE PROGETTO) ---
     def render_t(d, t):
         if d.empty: st.info(f"No data for {t}"); return
-        
-        # A. Recupera errori Pull (Triangolo)
-        pull_status = st.session_state.get('pull_status', {})
-        failed_repos = [r for r, ok in pull_status.items() if not ok]
-        proj_with_errors = []
-        if 'RepoFolder' in d.columns:
-            proj_with_errors = d[d['RepoFolder'].isin(failed_repos)]['Progetto'].unique()
-
-        # B. Recupera modifiche locali (Matita)
-        proj_dirty_map = {}
-        if 'IsChange' in d.columns:
-            dirty_rows = d[d['IsChange'] == True]
-            if not dirty_rows.empty:
-                # Mappa Progetto -> Lista Ambienti
-                proj_dirty_map = dirty_rows.groupby('Progetto')['Ambiente'].apply(lambda x: list(set(x))).to_dict()
-        
-        # C. Pivot Tabella
-        g = d.groupby(['Progetto', 'Ambiente'], as_index=False).agg({
-            'Info': lambda x: '<div class="inner-cell">' + 
-                              '<br>'.join([str(val).replace('\n', '<br>') for val in x if str(val).strip() != ""]) + 
-                              '</div>'
-        })
-        
-        m = g.pivot(index="Progetto", columns="Ambiente", values="Info")
-        m.columns.name = None 
-        
-        cols = [c for c in PRIORITY_ORDER if c in m.columns] + sorted([c for c in m.columns if c not in PRIORITY_ORDER])
-        m = m.reindex(columns=cols).fillna("") 
-        
-        m_reset = m.reset_index()
-        
-        # D. Formattazione Colonna Progetto con Icone
-        def format_project_cell(name):
-            icons = ""
-            
-            # Icona Errore Pull
-            if name in proj_with_errors:
-                icons += '<span style="color:orange; cursor:help; margin-right:5px;" title="Git pull fallito">⚠️</span>'
-            
-            # Icona Modifiche Locali
-            if name in proj_dirty_map:
-                icons += f'<span style="cursor:help; margin-right:5px;" title="Modifiche non committate/pushate">✏️</span>'
-            
-            return f'<div class="inner-cell" style="font-weight:bold;">{icons}{name}</div>'
-        
-        m_reset["Progetto"] = m_reset["Progetto"].apply(format_project_cell)
-        
-        html_table = m_reset.to_html(classes="cdc-table", index=False, escape=False, border=0)
-        st.markdown(f'<div class="cdc-table-container">{html_table}</div>', unsafe_allow_html=True)
+        failed_repos = [r for r, ok in sched_state['pull_status'].items() if not ok]
+        st.markdown(build_matrix_html(d, failed_repos, matched_cells, schema_cells), unsafe_allow_html=True)
 
     t1, t2 = st.tabs(["☁️ AWS", "🔷 Azure"])
     with t1: render_t(df_aws, "AWS")
     with t2: render_t(df_az, "Azure")
 
+    # --- PROMOZIONE AMBIENTI (dev -> testinfra -> systemdemo ...) ---
+    with st.expander("🚀 Promozione ambienti"):
+        all_envs = [e for e in PRIORITY_ORDER if e in set(df['Ambiente'])] + sorted(set(df['Ambiente']) - set(PRIORITY_ORDER))
+        pc1, pc2, pc3 = st.columns([1, 1, 1])
+        src_env = pc1.selectbox("Da", all_envs, key="promo_src")
+        dst_opts = [e for e in all_envs if e != src_env]
+        src_pos = all_envs.index(src_env) if src_env in all_envs else 0
+        dst_env = pc2.selectbox("A", dst_opts, index=min(src_pos, max(len(dst_opts) - 1, 0)), key="promo_dst")
+        if pc3.button("🧮 Calcola piano", use_container_width=True) and src_env and dst_env:
+            st.session_state['promo_plan'] = build_promotion_plan(ROOT_DIR, df, src_env, dst_env)
+            st.session_state['promo_envs'] = (src_env, dst_env)
+
+        plan = st.session_state.get('promo_plan')
+        if plan is not None and st.session_state.get('promo_envs') == (src_env, dst_env):
+            if not plan:
+                st.success(f"Nessuna differenza tra {src_env} e {dst_env}")
+            else:
+                plan_df = pd.DataFrame([{
+                    "Applica": item['Kind'] in DEFAULT_SELECTED_KINDS,
+                    "Progetto": item['Progetto'], "Tipo": item['Kind'], "Campo": item['Campo'],
+                    "Da": str(item['Da']), "A": str(item['A']),
+                    "File": os.path.relpath(item['File'], ROOT_DIR),
+                } for item in plan])
+                edited = st.data_editor(plan_df, hide_index=True, use_container_width=True,
+                                        disabled=[c for c in plan_df.columns if c != "Applica"], key="promo_editor")
+                selected = [item for item, keep in zip(plan, edited['Applica']) if keep]
+                # Bulk edit: verifica in blocco su ECR dei tag promossi (poche chiamate batch per tutto il piano)
+                tag_refs = {(ecr_repository_for_image(i['Image'], i['Progetto']), str(i['A'])) for i in selected if i['Kind'] == "Tag"}
+                tag_check, ecr_err = check_image_tags_exist({ref for ref in tag_refs if ref[0]}) if tag_refs else ({}, None)
+                missing_tags = [f"{repo}:{tag}" for (repo, tag), exists in tag_check.items() if not exists]
+                if ecr_err: st.warning(f"Check ECR non disponibile, tag non verificati: {ecr_err}")
+                if missing_tags: st.error(f"❌ Tag non presenti su ECR: {', '.join(sorted(missing_tags))}")
+                force = st.checkbox("Applica comunque", key="promo_force") if missing_tags else True
+                if st.button(f"✅ Applica piano ({len(selected)} modifiche)", type="primary", disabled=not selected or not force):
+                    ok, msg, _ = apply_promotion_plan(selected)
+                    invalidate_data()
+                    st.session_state.pop('promo_plan', None)
+                    if ok: st.toast(msg, icon="💾"); time.sleep(1); st.rerun()
+                    else: st.error(msg)
+
 st.divider()
 
 if st.button(f"🔍 Recupera versioni da ECR per {sel_proj}"):
     with st.spinner(f"Interrogando ECR per {sel_proj}..."):
-        data, error = get_ecr_versions(sel_proj)
+        data, error = get_ecr_versions_cached(sel_proj)
         
-        if error:
+        if error and not data:
             st.error(f"Errore nel recupero dati ECR: {error}")
-            st.info("Nota: Assicurati che il repository esista su ECR e che il profilo 'saml' sia attivo.")
+            st.info("Nota: Assicurati che il repository esista su ECR e che i profili dei registry in config.py siano attivi.")
         else:
+            if error: st.warning(f"Alcuni registry non hanno risposto: {error}")
             repo_key = list(data.keys())[0]
             st.success(f"Trovate {len(data[repo_key])} versioni valide per '{repo_key}'")
             with st.expander("Vedi elenco versioni (Ordinate per data)"):
@@ -287,98 +434,179 @@ btns = [
         }
     }
 ]
+@st.cache_data(show_spinner=False, max_entries=32)
+def cached_completions(values_content):
+    return generate_completions_from_yaml(values_content)
+
+def show_kustomize_result(rfolder, renv):
+    res = st.session_state.setdefault('kustomize_results', {}).get((rfolder, renv))
+    if res is None: return
+    kb_ok, kb_err = res
+    if not kb_ok:
+        st.error("❌ kustomize build fallito")
+        st.code(kb_err, language="text")
+    elif kb_err: st.caption(kb_err)
+    else: st.success("✅ kustomize build OK")
+
+def new_submit(editor_key, res):
+    """
+    True se res è un submit non ancora gestito: code_editor con key= restituisce lo stesso
+    valore a ogni rerun, quindi senza questo controllo ogni rerun risalverebbe il file.
+    """
+    if res['type'] != "submit" or not res['text']: return False
+    return st.session_state.setdefault('handled_submits', {}).get(editor_key) != res['id']
+
+def mark_submit_handled(editor_key, res):
+    st.session_state.setdefault('handled_submits', {})[editor_key] = res['id']
+
+@st.fragment
+def render_editor_row(row_key, ptype, rfolder, renv, tf_path, chart_version=None):
+    """
+    Blocco editor/salvataggio/diff/git di una riga. È un fragment: le interazioni
+    qui dentro rieseguono solo questo blocco, non load_data né la matrice.
+    Viene montato un solo editor alla volta (quello del file selezionato).
+    """
+    kustomize_results = st.session_state.setdefault('kustomize_results', {})
+    st.markdown(f"#### 👉 {ptype} (`{rfolder}`) (Env: {renv})")
+
+    # --- 5. EDITOR CON VALIDAZIONE ---
+    if ptype == "Terraform":
+        res = code_editor(get_file_content(tf_path), lang="terraform", height="300px", buttons=btns, options=ed_opts, key=f"tf_{row_key}")
+        if new_submit(f"tf_{row_key}", res):
+            mark_submit_handled(f"tf_{row_key}", res)
+            # Validazione
+            is_valid, err = is_valid_terraform(res['text'])
+            if is_valid:
+                save_file_content(tf_path, res['text'])
+                invalidate_data()
+                st.toast("✅ Salvato!", icon="💾")
+            else:
+                st.error(f"❌ Errore Sintassi Terraform: {err}")
+
+    elif ptype == "Kustomize":
+        base_f = os.path.join(ROOT_DIR, rfolder, renv)
+        p_ov = os.path.join(base_f, "overlays", "kustomization.yaml")
+        p_ba = os.path.join(base_f, "base", "kustomization.yaml")
+        active = st.radio("File", ["Overlay", "Base", "Chart Values"], horizontal=True,
+                          key=f"file_{row_key}", label_visibility="collapsed")
+
+        ref_c, _ = get_chart_values_content(ROOT_DIR, sel_proj, chart_version)
+        if not ref_c: ref_c, _ = get_chart_values_content(ROOT_DIR, rfolder.replace("-kustomization",""), chart_version)
+        comps = cached_completions(ref_c) if ref_c and active != "Chart Values" else []
+
+        if active == "Overlay":
+            r = code_editor(get_file_content(p_ov), lang="yaml", height="300px", buttons=btns, options=ed_opts, completions=comps, key=f"ov_{row_key}")
+            if new_submit(f"ov_{row_key}", r):
+                # Validazione
+                is_valid, err = is_valid_yaml(r['text'])
+                missing_tags = []
+                if is_valid:
+                    # Pre-save: i newTag referenziati devono esistere su ECR
+                    tag_check, ecr_err = check_image_tags_exist(image_refs_from_overlay(r['text'], rfolder.replace("-kustomization", "")))
+                    missing_tags = [f"{repo}:{tag}" for (repo, tag), exists in tag_check.items() if not exists]
+                    if ecr_err: st.warning(f"Check ECR non disponibile, tag non verificati: {ecr_err}")
+                # Bloccato da tag mancanti: il submit resta in sospeso finché non si spunta "Salva comunque"
+                # (una checkbox per submit: la conferma non resta spuntata per i salvataggi successivi)
+                if is_valid and missing_tags and not st.checkbox("Salva comunque", key=f"force_ov_{row_key}_{r['id']}"):
+                    st.error(f"❌ Tag non presenti su ECR: {', '.join(missing_tags)}")
+                elif is_valid:
+                    mark_submit_handled(f"ov_{row_key}", r)
+                    save_file_content(p_ov, r['text'])
+                    invalidate_data()
+                    st.toast("✅ Overlay Salvato!", icon="💾")
+                else:
+                    mark_submit_handled(f"ov_{row_key}", r)
+                    st.error(f"❌ Errore YAML: {err}")
+
+        elif active == "Base":
+            r = code_editor(get_file_content(p_ba), lang="yaml", height="300px", buttons=btns, options=ed_opts, completions=comps, key=f"ba_{row_key}")
+            if new_submit(f"ba_{row_key}", r):
+                mark_submit_handled(f"ba_{row_key}", r)
+                # Validazione
+                is_valid, err = is_valid_yaml(r['text'])
+                if is_valid:
+                    save_file_content(p_ba, r['text'])
+                    invalidate_data()
+                    st.toast("✅ Base Salvato!", icon="💾")
+                else:
+                    st.error(f"❌ Errore YAML: {err}")
+            unknown = validate_base_file(ROOT_DIR, sel_proj, p_ba)
+            if unknown:
+                st.warning("🧩 Chiavi valuesInline non presenti nel values.yaml del chart:\n\n" +
+                           "\n".join(f"- `{chart}`: `{path}`" for chart, path in unknown))
+
+        else:
+            if ref_c:
+                code_editor(ref_c, lang="yaml", height="300px", options={**ed_opts, "readOnly":True}, key=f"ref_{row_key}")
+            else:
+                st.warning(f"File values.yaml non trovato per {sel_proj}" + (f" (chart {chart_version})." if chart_version else "."))
+                dc1, dc2 = st.columns(2)
+                # Scarica solo values.yaml/Chart.yaml della versione in uso (niente clone completo)
+                if dc1.button(f"⬇️ Scarica values.yaml ({chart_version or 'ultima'})", key=f"dl_values_{row_key}"):
+                    submit_git_job(os.path.join(CHART_CACHE_DIR, sel_proj), "Download values.yaml",
+                                   fetch_chart_values, ROOT_DIR, sel_proj, rfolder, chart_version, row_key=row_key)
+                if dc2.button(f"⬇️ Clona Chart ({sel_proj}-chart)", key=f"dl_chart_{row_key}"):
+                    submit_git_job(os.path.join(ROOT_DIR, f"{sel_proj}-chart"), "Clone chart",
+                                   git_clone_related_chart, ROOT_DIR, sel_proj, rfolder, row_key=row_key)
+
+        # --- VALIDAZIONE KUSTOMIZE BUILD (esito mostrato qui, accanto all'editor) ---
+        if st.button("🧪 kustomize build", key=f"kb_{row_key}", help="Verifica che overlay/base vengano renderizzati"):
+            with st.spinner("kustomize build..."):
+                for e, r in validate_envs(os.path.join(ROOT_DIR, rfolder), [renv]).items():
+                    kustomize_results[(rfolder, e)] = r
+        show_kustomize_result(rfolder, renv)
+    
+    diff = get_git_diff(ROOT_DIR, rfolder)
+    if diff:
+        st.warning("⚠️ Modifiche non committate")
+        with st.expander("🔍 Vedi Git Diff", expanded=True): st.code(diff, language="diff")
+    else: st.success("Working tree clean")
+
+    with st.expander("🚀 Gestione Git"):
+        c1, c2 = st.columns([3, 1])
+        msg = c1.text_input("Messaggio", key=f"m_{row_key}")
+        if c2.button("💾 Commit & Push", key=f"p_{row_key}"):
+            repo_abs = os.path.join(ROOT_DIR, rfolder)
+            failed_envs = []
+            if msg and ptype == "Kustomize":
+                # Pre-push: kustomize build di tutti gli ambienti toccati (in parallelo, con cache per tree hash)
+                with st.spinner("kustomize build degli ambienti modificati..."):
+                    for e, r in validate_envs(repo_abs, touched_envs(repo_abs)).items():
+                        kustomize_results[(rfolder, e)] = r
+                        if not r[0]: failed_envs.append(e)
+                if failed_envs:
+                    st.error(f"❌ Push bloccato: kustomize build fallito per {', '.join(failed_envs)}")
+                    for e in failed_envs:
+                        st.code(f"[{e}] {kustomize_results[(rfolder, e)][1]}", language="text")
+            if msg and not failed_envs:
+                submit_git_job(repo_abs, "Commit & Push", git_commit_push, repo_abs, msg, row_key=row_key)
+        st.divider()
+        cr1, cr2 = st.columns([3, 1])
+        cr1.caption("⚠️ Attenzione: Cancella modifiche locali.")
+        if cr2.button("🗑️ Ripristina", key=f"rst_{row_key}", type="primary"):
+            repo_abs = os.path.join(ROOT_DIR, rfolder)
+            submit_git_job(repo_abs, "Ripristina", git_hard_reset, repo_abs, row_key=row_key)
+    # Esito dell'ultimo job git lanciato da questa riga (a job concluso la pagina si aggiorna da sola)
+    show_row_job(row_key)
+    st.divider()
+
 if sel_proj and target_real_envs:
     rows = df[(df['Progetto'] == sel_proj) & (df['Ambiente'].isin(target_real_envs))]
-    rows = rows[~mask_azure.loc[rows.index]] if cloud_filter == "☁️ AWS" else rows[mask_azure.loc[rows.index]]
+    rows = rows[rows['Cloud'] == ("aws" if cloud_filter == "☁️ AWS" else "azure")]
 
     if rows.empty: st.info("Nessuna riga trovata.")
     else:
         st.subheader(f"📝 Modifica: {sel_proj} / {sel_env_display}")
-        for idx, row in rows.iterrows():
-            ptype = row['Tipo']
-            rfolder = row['RepoFolder']
-            renv = row['Ambiente']
-            
-            comps = []
-            ref_c, _ = get_chart_values_content(ROOT_DIR, sel_proj)
-            if not ref_c: ref_c, _ = get_chart_values_content(ROOT_DIR, rfolder.replace("-kustomization",""))
-            if ptype == "Kustomize" and ref_c: comps = generate_completions_from_yaml(ref_c)
-
-            with st.container():
-                st.markdown(f"#### 👉 {ptype} (`{rfolder}`) (Env: {renv})")
-                
-                # --- 5. EDITOR CON VALIDAZIONE ---
-                if ptype == "Terraform":
-                    tf_p = row['FilePath']
-                    res = code_editor(get_file_content(tf_p), lang="terraform", height="300px", buttons=btns, options=ed_opts, key=f"tf_{idx}")
-                    if res['type'] == "submit" and res['text']:
-                        # Validazione
-                        is_valid, err = is_valid_terraform(res['text'])
-                        if is_valid:
-                            save_file_content(tf_p, res['text'])
-                            st.toast("✅ Salvato!", icon="💾")
-                        else:
-                            st.error(f"❌ Errore Sintassi Terraform: {err}")
-
-                elif ptype == "Kustomize":
-                    base_f = os.path.join(ROOT_DIR, rfolder, renv)
-                    p_ov = os.path.join(base_f, "overlays", "kustomization.yaml")
-                    p_ba = os.path.join(base_f, "base", "kustomization.yaml")
-                    tb1, tb2, tb3 = st.tabs(["Overlay", "Base", "Chart Values"])
-                    
-                    with tb1:
-                        r = code_editor(get_file_content(p_ov), lang="yaml", height="300px", buttons=btns, options=ed_opts, completions=comps, key=f"ov_{idx}")
-                        if r['type'] == "submit" and r['text']: 
-                            # Validazione
-                            is_valid, err = is_valid_yaml(r['text'])
-                            if is_valid:
-                                save_file_content(p_ov, r['text'])
-                                st.toast("✅ Overlay Salvato!", icon="💾")
-                            else:
-                                st.error(f"❌ Errore YAML: {err}")
-
-                    with tb2:
-                        r = code_editor(get_file_content(p_ba), lang="yaml", height="300px", buttons=btns, options=ed_opts, completions=comps, key=f"ba_{idx}")
-                        if r['type'] == "submit" and r['text']: 
-                            # Validazione
-                            is_valid, err = is_valid_yaml(r['text'])
-                            if is_valid:
-                                save_file_content(p_ba, r['text'])
-                                st.toast("✅ Base Salvato!", icon="💾")
-                            else:
-                                st.error(f"❌ Errore YAML: {err}")
-
-                    with tb3:
-                         if ref_c:
-                             code_editor(ref_c, lang="yaml", height="300px", options={**ed_opts, "readOnly":True}, key=f"ref_{idx}")
-                         else:
-                             st.warning(f"File values.yaml non trovato per {sel_proj}.")
-                             if st.button(f"⬇️ Scarica Chart ({sel_proj}-chart)", key=f"dl_chart_{idx}"):
-                                 with st.spinner("Clonazione..."):
-                                     ok, msg = git_clone_related_chart(ROOT_DIR, sel_proj, rfolder)
-                                     if ok: st.success(msg); time.sleep(1); st.rerun()
-                                     else: st.error(msg)
-                
-                diff = get_git_diff(ROOT_DIR, rfolder)
-                if diff:
-                    st.warning("⚠️ Modifiche non committate")
-                    with st.expander("🔍 Vedi Git Diff", expanded=True): st.code(diff, language="diff")
-                else: st.success("Working tree clean")
-
-                with st.expander("🚀 Gestione Git"):
-                    c1, c2 = st.columns([3, 1])
-                    msg = c1.text_input("Messaggio", key=f"m_{idx}")
-                    if c2.button("💾 Commit & Push", key=f"p_{idx}"):
-                        if msg:
-                            with st.spinner("Pushing..."):
-                                ok, res = git_commit_push(os.path.join(ROOT_DIR, rfolder), msg)
-                                if ok: st.success(res); time.sleep(1); st.rerun()
-                                else: st.error(res)
-                    st.divider()
-                    cr1, cr2 = st.columns([3, 1])
-                    cr1.caption("⚠️ Attenzione: Cancella modifiche locali.")
-                    if cr2.button("🗑️ Ripristina", key=f"rst_{idx}", type="primary"):
-                         with st.spinner("Reset..."):
-                             ok, res = git_hard_reset(os.path.join(ROOT_DIR, rfolder))
-                             st.toast(res); time.sleep(1); st.rerun()
-                st.divider()
\ No newline at end of file
+        # Un progetto virtuale con più regole ha più righe per lo stesso file: un solo editor per repo/ambiente
+        for row in rows.drop_duplicates(['RepoFolder', 'Ambiente']).itertuples(index=False):
+            render_editor_row(f"{row.RepoFolder}:{row.Ambiente}", row.Tipo, row.RepoFolder, row.Ambiente, row.FilePath,
+                              row.ChartVersion if isinstance(row.ChartVersion, str) else None)
+
+# --- RISULTATI PROFILING (fine rerun) ---
+if rerun_profiler:
+    prof_stats = rerun_profiler.stop()
+    st.session_state.pop('rerun_profiler', None)
+    with st.sidebar.expander(f"⏱️ Profilo rerun ({rerun_profiler.elapsed * 1000:.0f} ms)", expanded=True):
+        st.dataframe(hot_functions(prof_stats), hide_index=True, use_container_width=True)
+        st.download_button("⬇️ Scarica .pstats", stats_bytes(prof_stats), file_name="rerun.pstats",
+                           help="Apribile con snakeviz o convertibile in flamegraph (flameprof, gprof2dot)")
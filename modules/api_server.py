@@ -0,0 +1,139 @@
+import os
+import json
+import hashlib
+import argparse
+import threading
+import pandas as pd
+import streamlit as st
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from modules.data_loader import get_cached_data, refresh_in_background
+from modules.shared_cache import get_shared_cache
+from modules.snapshot import load_snapshot, load_snapshot_meta
+
+DEFAULT_API_PORT = 8765
+
+class MatrixApi:
+    """
+    Sorgente dati dell'endpoint JSON: scansione condivisa (se la UI gira nello stesso processo)
+    o snapshot su disco, più stato pull/sync. Il body JSON e il suo ETag sono calcolati una
+    volta per versione dei dati (e per filtro progetto): un client che fa polling senza
+    novità riceve un 304 senza che nulla venga serializzato.
+    """
+    def __init__(self, root_dir, state_fn=None):
+        self.root_dir = root_dir
+        self.state_fn = state_fn  # es. scheduler.snapshot; None = metadati dello snapshot
+        self._lock = threading.Lock()
+        self._snapshot = (None, None)  # (saved_at, DataFrame)
+        self._bodies = {}              # progetto -> (etag, body) per la versione dati corrente
+        self._version = None
+        self._df = None
+
+    def _matrix(self):
+        df = get_shared_cache().get(f"scan:{self.root_dir}")
+        if df is not None: return df, "scan"
+        # Cache fredda o invalidata: si risponde subito dallo snapshot e si rifà la scansione dietro
+        meta = load_snapshot_meta(self.root_dir)
+        if meta.get("saved_at"):
+            refresh_in_background(self.root_dir)
+            with self._lock:
+                if self._snapshot[0] == meta["saved_at"]: return self._snapshot[1], "snapshot"
+            snap_df, snap_meta = load_snapshot(self.root_dir)
+            if snap_df is not None:
+                with self._lock: self._snapshot = (snap_meta["saved_at"], snap_df)
+                return snap_df, "snapshot"
+        return get_cached_data(self.root_dir), "scan"
+
+    def _state(self):
+        if self.state_fn: state = self.state_fn()
+        else: state = load_snapshot_meta(self.root_dir)
+        return {
+            "pull_status": state.get("pull_status", {}),
+            "last_synced": state.get("last_synced", {}),
+            "sync_counts": state.get("sync_counts"),
+        }
+
+    def response(self, project=None):
+        """Returns: (etag, body bytes) per la matrice (eventualmente filtrata per progetto)."""
+        df, source = self._matrix()
+        state = self._state()
+        version = (id(df), source, json.dumps(state, sort_keys=True))
+        with self._lock:
+            if version != self._version:
+                # Il riferimento a df tiene vivo l'oggetto: il suo id() nella chiave non può essere riusato
+                self._version, self._bodies, self._df = version, {}, df
+            cached = self._bodies.get(project)
+        if cached: return cached
+
+        rows = df if not project else df[df['Progetto'] == project]
+        records = [{k: (None if not isinstance(v, str) and pd.isna(v) else v) for k, v in rec.items()}
+                   for rec in rows.astype(object).to_dict('records')]
+        if project:
+            # Stato pull/sync solo dei repo del progetto filtrato
+            repos = set(rows['RepoFolder'])
+            state = {**state, **{key: {r: v for r, v in state[key].items() if r in repos}
+                                 for key in ("pull_status", "last_synced")}}
+        body = json.dumps({"source": source, "root_dir": self.root_dir, **state, "rows": records},
+                          sort_keys=True, default=str).encode()
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        with self._lock:
+            if self._version == version: self._bodies[project] = (etag, body)
+        return etag, body
+
+def _make_handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/health": return self._send(200, b'{"ok": true}')
+            if url.path != "/matrix": return self._send(404, b'{"error": "not found"}')
+            project = (parse_qs(url.query).get("project") or [None])[0]
+            try: etag, body = api.response(project)
+            except Exception as e: return self._send(500, json.dumps({"error": str(e)}).encode())
+            if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+                return self._send(304, None, etag)
+            self._send(200, body, etag)
+
+        def _send(self, code, body, etag=None):
+            self.send_response(code)
+            if etag: self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            if body is not None:
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body is not None: self.wfile.write(body)
+
+        def log_message(self, format, *args): pass  # niente log per ogni richiesta di polling
+    return Handler
+
+def start_api_server(root_dir, port=DEFAULT_API_PORT, host="127.0.0.1", state_fn=None):
+    """Avvia l'endpoint in un thread daemon. Returns: il server (server.shutdown() per fermarlo)."""
+    server = ThreadingHTTPServer((host, port), _make_handler(MatrixApi(root_dir, state_fn)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="cdc-api", daemon=True).start()
+    return server
+
+@st.cache_resource(show_spinner=False)
+def get_api_server(root_dir, port, _state_fn=None):
+    """Un solo endpoint per processo accanto alla UI (porta da CDC_API_PORT o "api_port" nei settings)."""
+    return start_api_server(root_dir, port, state_fn=_state_fn)
+
+def main():
+    """Modalità standalone (senza UI), dalla cartella dell'app: python -m modules.api_server --root ../cdc"""
+    from modules.scheduler import RefreshScheduler, DEFAULT_REFRESH_INTERVAL
+    parser = argparse.ArgumentParser(description="Endpoint JSON read-only della matrice versioni")
+    parser.add_argument("--root", required=True, help="ROOT_DIR con i repository")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_API_PORT)
+    parser.add_argument("--interval", type=int, default=DEFAULT_REFRESH_INTERVAL, help="intervallo sync (s)")
+    args = parser.parse_args()
+
+    # Come nella UI: sync periodico in background, la scansione si invalida solo se arrivano novità
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    scheduler = RefreshScheduler(args.root, app_dir, args.interval)
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(MatrixApi(args.root, scheduler.snapshot)))
+    print(f"CDC API su http://{args.host}:{args.port}/matrix")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import threading
+from functools import lru_cache
+from modules.yaml_manager import _new_yaml, load_yaml_cached, get_file_content, chart_values_file
+
+@lru_cache(maxsize=64)
+def build_key_index(values_content):
+    """
+    Indice delle chiavi valide di un values.yaml: (path validi, path di mappe aperte), None se non parsabile.
+    Come generate_completions_from_yaml le liste sono trasparenti (nessun indice nel path);
+    una chiave con valore vuoto ({}, [] o null) è una mappa aperta: sotto vale qualsiasi chiave.
+    Calcolato una volta per contenuto, cioè per versione del chart.
+    """
+    paths, open_maps = set(), set()
+    try: data = _new_yaml().load(values_content)
+    except Exception: return None
+
+    def walk(obj, prefix):
+        if isinstance(obj, dict):
+            for key, value in obj.items():
+                path = prefix + (str(key),)
+                paths.add(path)
+                if value is None or (isinstance(value, (dict, list)) and not value): open_maps.add(path)
+                walk(value, path)
+        elif isinstance(obj, list):
+            for item in obj: walk(item, prefix)
+    walk(data, ())
+    return frozenset(paths), frozenset(open_maps)
+
+def unknown_keys(values_inline, index):
+    """Path (a.b.c) di valuesInline che non esistono nel values.yaml del chart."""
+    paths, open_maps = index
+    found = []
+
+    def walk(obj, prefix):
+        if isinstance(obj, dict):
+            for key, value in obj.items():
+                path = prefix + (str(key),)
+                if any(path[:i] in open_maps for i in range(1, len(path))): continue
+                if path not in paths:
+                    found.append(".".join(path))
+                    continue
+                walk(value, path)
+        elif isinstance(obj, list):
+            for item in obj: walk(item, prefix)
+    walk(values_inline, ())
+    return found
+
+def _chart_index(root_dir, project, chart_version):
+    # Senza versione fissata non si verifica: meglio non verificare che verificare contro un'altra versione
+    values = chart_values_file(root_dir, project, chart_version) if chart_version else None
+    content = get_file_content(values) if values else None
+    return build_key_index(content) if content else None
+
+def validate_base_file(root_dir, project, base_file):
+    """
+    Chiavi sconosciute dei valuesInline di un base/kustomization.yaml.
+    Returns: lista di (chart, path). I chart senza values.yaml della versione fissata non vengono verificati.
+    """
+    data = load_yaml_cached(base_file)
+    if not data or not isinstance(data.get('helmCharts'), list): return []
+    issues = []
+    for chart in data['helmCharts']:
+        if not isinstance(chart, dict) or not chart.get('valuesInline'): continue
+        version = str(chart['version']) if chart.get('version') else None
+        index = _chart_index(root_dir, project, version)
+        if index is None and chart.get('name'): index = _chart_index(root_dir, chart['name'], version)
+        if index is None: continue
+        issues += [(chart.get('name'), path) for path in unknown_keys(chart['valuesInline'], index)]
+    return issues
+
+_last_result = (None, {})
+_last_result_lock = threading.Lock()
+
+def validate_all(root_dir, df):
+    """
+    Verifica in un solo passaggio tutti gli ambienti Kustomize della matrice.
+    Returns: {(RepoFolder, Ambiente): [(chart, path), ...]} solo per gli ambienti con problemi.
+    Il risultato è riusato finché la scansione (df) non cambia.
+    """
+    global _last_result
+    with _last_result_lock:
+        if _last_result[0] is df: return _last_result[1]
+    result = {}
+    if not df.empty:
+        kust = df[(df['Tipo'] == "Kustomize") & (~df['Virtual'])]
+        for repo_folder, project, env in kust[['RepoFolder', 'Progetto', 'Ambiente']].drop_duplicates().itertuples(index=False):
+            base_file = os.path.join(root_dir, repo_folder, env, "base", "kustomization.yaml")
+            try: issues = validate_base_file(root_dir, project, base_file)
+            except Exception: issues = []
+            if issues: result[(repo_folder, env)] = issues
+    with _last_result_lock:
+        _last_result = (df, result)
+    return result
@@ -1,111 +1,208 @@
 import os
 import pandas as pd
 import json
-from modules.yaml_manager import read_kustomize_values, get_yaml_value_by_path
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from modules.yaml_manager import read_kustomize_values, evaluate_rules
 from modules.terraform_manager import get_tf_version
 from modules.git_manager import get_repo_sync_status
+from modules.shared_cache import get_shared_cache
+from modules.snapshot import save_snapshot
+from modules.profiler import profiled
 
-def load_data(root_dir):
-    rows = []
-    if not os.path.exists(root_dir): return pd.DataFrame()
+# Colonne del modello dati della matrice (nessun HTML: la presentazione è in modules/ui.py)
+COLUMNS = ["Progetto", "Ambiente", "BaseEnv", "Cloud", "Tipo", "Tag", "ChartVersion", "TfVersion",
+           "Virtual", "Label", "RepoFolder", "FilePath", "IsChange"]
+CATEGORICAL_COLUMNS = ["Progetto", "Ambiente", "BaseEnv", "Cloud", "Tipo", "Tag", "ChartVersion", "TfVersion", "Label", "RepoFolder"]
+
+def _clean_value(val):
+    """Normalizza i placeholder ('-', 'N/A', vuoto) a None."""
+    if val is None: return None
+    val = str(val).strip()
+    return None if val in ["", "-", "N/A"] else val
+
+def _is_azure(repo_folder, env):
+    repo = repo_folder.strip().lower()
+    return repo.endswith('-az') or '-az-' in repo or env.strip().lower().endswith('-az')
+
+def _make_row(project, env, ptype, repo_folder, has_changes, tag=None, chart_version=None,
+              tf_version=None, file_path=None, virtual=False, label=None):
+    return {
+        "Progetto": project, "Ambiente": env,
+        "BaseEnv": env[:-3] if env.endswith('-az') else env,
+        "Cloud": "azure" if _is_azure(repo_folder, env) else "aws",
+        "Tipo": ptype,
+        "Tag": _clean_value(tag), "ChartVersion": _clean_value(chart_version), "TfVersion": _clean_value(tf_version),
+        "Virtual": virtual, "Label": label or None, "RepoFolder": repo_folder, "FilePath": file_path,
+        "IsChange": has_changes,
+    }
 
-    virtual_projects = []
+def _to_frame(rows):
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype("category")
+    df["Virtual"] = df["Virtual"].astype(bool)
+    df["IsChange"] = df["IsChange"].astype(bool)
+    return df
+
+def _read_virtual_projects():
     config_path = os.path.join(".cdc_config", "repo_config.json")
     if os.path.exists(config_path):
         try:
             with open(config_path, 'r') as f:
                 data = json.load(f)
-                if "virtual" in data: virtual_projects = data["virtual"]
+                if "virtual" in data: return data["virtual"]
         except: pass
+    return []
 
-    physical_folders = sorted(os.listdir(root_dir))
-    git_status_cache = {}
+def _load_folder_rows(root_dir, folder, get_status):
+    rows = []
+    folder_path = os.path.join(root_dir, folder)
 
-    def get_cached_status(r_path):
-        if r_path not in git_status_cache:
-            git_status_cache[r_path] = get_repo_sync_status(r_path)
-        return git_status_cache[r_path]
-
-    def icon(char):
-        return f'<span class="no-select">{char}</span>'
-
-    for folder in physical_folders:
-        folder_path = os.path.join(root_dir, folder)
-        if not os.path.isdir(folder_path): continue
-
-        # --- MODIFICA 1: Calcoliamo solo il booleano, NON creiamo la stringa badge ---
-        is_dirty, is_ahead = get_cached_status(folder_path)
-        has_changes = is_dirty or is_ahead
-
-        if folder.endswith("-kustomization"):
-            proj = folder.replace("-kustomization", "")
-            for env in sorted(os.listdir(folder_path)):
-                if os.path.isdir(os.path.join(folder_path, env, "overlays")):
-                    tag, chart = read_kustomize_values(root_dir, proj, env)
-                    info_text = ""
-                    
-                    if tag and tag not in ["-", "N/A"]: 
-                        info_text += f"{icon('🐬 ')}{tag}\n"
-                    
-                    if chart and chart not in ["-", "N/A"]: 
-                        info_text += f"{icon('☸️ ')}{chart}"
-                    
-                    # --- MODIFICA 2: NON aggiungiamo più git_badge a info_text ---
-                    
-                    rows.append({
-                        "Progetto": proj, "Ambiente": env, "Tipo": "Kustomize",
-                        "Info": info_text.strip(), "RepoFolder": folder, "FilePath": None,
-                        "IsChange": has_changes # Nuova colonna dati
-                    })
-
-        elif "-config-" in folder:
-            parts = folder.split("-config-")
-            proj = parts[0]
-            env_root = os.path.join(folder_path, "environments")
-            if os.path.exists(env_root) and os.path.isdir(env_root):
-                for env in sorted(os.listdir(env_root)):
-                    main_tf_path = os.path.join(env_root, env, "main.tf")
-                    if os.path.exists(main_tf_path):
-                        tf_ver = get_tf_version(main_tf_path)
-                        info_text = ""
-                        
-                        if tf_ver and tf_ver not in ["-", "N/A"]:
-                            info_text = f"{icon('🏗️ TF: ')}{tf_ver}"
-                        
-                        # --- ANCHE QUI: Niente badge nel testo ---
-                        
-                        rows.append({
-                            "Progetto": proj, "Ambiente": env, "Tipo": "Terraform",
-                            "Info": info_text.strip(), "RepoFolder": folder, "FilePath": main_tf_path,
-                            "IsChange": has_changes
-                        })
+    # --- MODIFICA 1: Calcoliamo solo il booleano, NON creiamo la stringa badge ---
+    is_dirty, is_ahead = get_status(folder_path)
+    has_changes = is_dirty or is_ahead
 
-    for vp in virtual_projects:
+    if folder.endswith("-kustomization"):
+        proj = folder.replace("-kustomization", "")
+        for env in sorted(os.listdir(folder_path)):
+            if os.path.isdir(os.path.join(folder_path, env, "overlays")):
+                tag, chart = read_kustomize_values(root_dir, proj, env)
+                rows.append(_make_row(proj, env, "Kustomize", folder, has_changes,
+                                      tag=tag, chart_version=chart))
+
+    elif "-config-" in folder:
+        parts = folder.split("-config-")
+        proj = parts[0]
+        env_root = os.path.join(folder_path, "environments")
+        if os.path.exists(env_root) and os.path.isdir(env_root):
+            for env in sorted(os.listdir(env_root)):
+                main_tf_path = os.path.join(env_root, env, "main.tf")
+                if os.path.exists(main_tf_path):
+                    tf_ver = get_tf_version(main_tf_path)
+                    rows.append(_make_row(proj, env, "Terraform", folder, has_changes,
+                                          tf_version=tf_ver, file_path=main_tf_path))
+    return rows
+
+def _virtual_fields(vp):
+    """Campi di un progetto virtuale: 'fields' (regole multiple) o il vecchio 'path' singolo."""
+    return vp.get('fields') or [{"label": "", "path": vp['path']}]
+
+def _load_virtual_rows(root_dir, source_folder, vps, get_status):
+    """
+    Righe di tutti i progetti virtuali che leggono dallo stesso repo sorgente:
+    per ogni ambiente le regole di tutti i progetti vengono valutate con un solo parse del file base.
+    """
+    rows = []
+    source_abs_path = os.path.join(root_dir, source_folder)
+    if not os.path.exists(source_abs_path): return rows
+
+    is_dirty, is_ahead = get_status(source_abs_path)
+    has_changes = is_dirty or is_ahead
+
+    rules = []  # (chiave regola, progetto, label, espressione)
+    for vp in vps:
         virt_name = vp['name']
-        source_folder = vp['source']
-        yaml_key_path = vp['path']
-        
         proj_display = virt_name.replace("-kustomization", "") if virt_name.endswith("-kustomization") else virt_name
-        source_abs_path = os.path.join(root_dir, source_folder)
-        
-        is_dirty, is_ahead = get_cached_status(source_abs_path)
-        has_changes = is_dirty or is_ahead
-
-        if os.path.exists(source_abs_path):
-            for env in sorted(os.listdir(source_abs_path)):
-                base_dir = os.path.join(source_abs_path, env)
-                if os.path.isdir(os.path.join(base_dir, "overlays")):
-                    target_file = os.path.join(base_dir, "base", "kustomization.yaml")
-                    val = get_yaml_value_by_path(target_file, yaml_key_path)
-                    
-                    info_text = ""
-                    if val and val not in ["-", "N/A"]:
-                        info_text = f"{icon('🐬 ')}{val}"
-
-                    rows.append({
-                        "Progetto": proj_display, "Ambiente": env, "Tipo": "Kustomize",
-                        "Info": info_text.strip(), "RepoFolder": source_folder, "FilePath": None,
-                        "IsChange": has_changes
-                    })
-
-    return pd.DataFrame(rows)
\ No newline at end of file
+        for i, field in enumerate(_virtual_fields(vp)):
+            rules.append((f"{virt_name}#{i}", proj_display, field.get('label', ""), field['path']))
+
+    for env in sorted(os.listdir(source_abs_path)):
+        base_dir = os.path.join(source_abs_path, env)
+        if os.path.isdir(os.path.join(base_dir, "overlays")):
+            target_file = os.path.join(base_dir, "base", "kustomization.yaml")
+            values = evaluate_rules(target_file, [(key, expr) for key, _, _, expr in rules])
+            for key, proj_display, label, _ in rules:
+                rows.append(_make_row(proj_display, env, "Kustomize", source_folder, has_changes,
+                                      tag=values[key], virtual=True, label=label))
+    return rows
+
+def _group_virtual_by_source(virtual_projects):
+    groups = {}
+    for vp in virtual_projects:
+        groups.setdefault(vp['source'], []).append(vp)
+    return groups
+
+def iter_load_data(root_dir, max_workers=8):
+    """
+    Variante streaming di load_data: scansiona i repo in PARALLELO e restituisce
+    (nome_repo, righe, repo_in_attesa) appena ogni repo è pronto, nell'ordine di completamento.
+    """
+    if not os.path.exists(root_dir): return
+
+    git_status_cache = {}
+    status_lock = threading.Lock()
+
+    def get_cached_status(r_path):
+        with status_lock:
+            if r_path in git_status_cache: return git_status_cache[r_path]
+        status = get_repo_sync_status(r_path)
+        with status_lock: git_status_cache[r_path] = status
+        return status
+
+    tasks = {}
+    for folder in sorted(os.listdir(root_dir)):
+        if os.path.isdir(os.path.join(root_dir, folder)):
+            tasks[folder] = (_load_folder_rows, folder)
+    for source, vps in _group_virtual_by_source(_read_virtual_projects()).items():
+        tasks[f"virtual:{source}"] = (_load_virtual_rows, source, vps)
+    if not tasks: return
+
+    pending = set(tasks)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(profiled(fn), root_dir, *args, get_cached_status): name for name, (fn, *args) in tasks.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            pending.discard(name)
+            try: rows = future.result()
+            except Exception: rows = []
+            yield name, rows, sorted(pending)
+
+def load_data(root_dir, on_progress=None):
+    """
+    Scansione completa della matrice. Se on_progress è passato, viene chiamato dopo ogni repo
+    con (DataFrame parziale, repo_in_attesa) per il rendering progressivo.
+    """
+    if not os.path.exists(root_dir): return _to_frame([])
+    order = {name: i for i, name in enumerate(
+        [f for f in sorted(os.listdir(root_dir)) if os.path.isdir(os.path.join(root_dir, f))] +
+        [f"virtual:{source}" for source in _group_virtual_by_source(_read_virtual_projects())]
+    )}
+    rows_by_repo = {}
+    for name, rows, pending in iter_load_data(root_dir):
+        rows_by_repo[name] = rows
+        if on_progress and rows:
+            on_progress(_to_frame([r for n in sorted(rows_by_repo, key=lambda n: order.get(n, len(order))) for r in rows_by_repo[n]]), pending)
+
+    # Ordine stabile (cartelle fisiche ordinate, poi progetti virtuali), indipendente dai tempi di completamento
+    return _to_frame([r for n in sorted(rows_by_repo, key=lambda n: order.get(n, len(order))) for r in rows_by_repo[n]])
+
+_scan_progress = {}  # root_dir -> (DataFrame parziale, repo in attesa) della scansione in corso
+_scan_progress_lock = threading.Lock()
+
+def get_scan_progress(root_dir):
+    """Risultato parziale della scansione in corso per ROOT_DIR: (DataFrame, repo in attesa) o None."""
+    with _scan_progress_lock:
+        return _scan_progress.get(root_dir)
+
+def _scan(root_dir):
+    # Nessun callback di UI nel calcolo condiviso: i parziali vengono pubblicati e ogni sessione li legge
+    def publish(partial_df, pending):
+        with _scan_progress_lock: _scan_progress[root_dir] = (partial_df, pending)
+    try: df = load_data(root_dir, publish)
+    finally:
+        with _scan_progress_lock: _scan_progress.pop(root_dir, None)
+    save_snapshot(root_dir, df=df)
+    return df
+
+def get_cached_data(root_dir):
+    """
+    Scansione condivisa tra tutte le sessioni: una sola load_data in corso per ROOT_DIR,
+    le altre sessioni attendono il risultato. Invalidata dopo pull/salvataggi/push.
+    I risultati parziali sono disponibili con get_scan_progress.
+    """
+    return get_shared_cache().get_or_compute(f"scan:{root_dir}", lambda: _scan(root_dir))
+
+def refresh_in_background(root_dir):
+    """Avvia la scansione condivisa in un thread (se non è già in corso), senza bloccare la pagina."""
+    get_shared_cache().compute_in_background(f"scan:{root_dir}", lambda: _scan(root_dir), name="cdc-scan")
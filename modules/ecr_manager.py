@@ -1,45 +1,220 @@
 import streamlit as st
 import boto3
 import re
-from config import ECR_ROOT
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from ruamel.yaml import YAML
+from config import ECR_ROOT, REGISTRIES
+from modules.shared_cache import get_shared_cache
 
-def get_ecr_versions(project_name):
+ECR_CACHE_TTL = 300  # secondi
+TAG_CHECK_TTL = 120  # secondi
+TAG_CHECK_ERROR_TTL = 60  # secondi: un registry irraggiungibile non viene riprovato a ogni rerun
+BATCH_GET_IMAGE_LIMIT = 100  # massimo imageIds per chiamata batch_get_image
+
+_tag_cache = {}  # (repository, tag) -> (esiste, timestamp)
+_tag_cache_lock = threading.Lock()
+_registry_errors = {}  # (profile, region, account) -> (errore, timestamp)
+
+_client_pool = {}  # (profile, region) -> client botocore riusato
+_client_pool_lock = threading.Lock()
+_client_config = Config(connect_timeout=5, read_timeout=15, retries={"max_attempts": 2})
+
+def _ecr_client(profile='saml', region='eu-central-1'):
+    """Client ECR condiviso per (profilo, regione): i client boto3 sono thread-safe, le Session no."""
+    key = (profile, region)
+    with _client_pool_lock:
+        if key not in _client_pool:
+            session = boto3.Session(profile_name=profile, region_name=region)
+            _client_pool[key] = session.client('ecr', config=_client_config)
+        return _client_pool[key]
+
+def _registry_client(registry):
+    return _ecr_client(registry.get('profile'), registry.get('region'))
+
+def _query_registry(registry, repo_name):
+    """Versioni (tag N.N.N*) di un repository su un singolo registry."""
+    if registry.get('type', 'ecr') != 'ecr':
+        raise ValueError(f"Registry di tipo '{registry.get('type')}' non ancora supportato")
+
+    ecr = _registry_client(registry)
+    params = {"repositoryName": f"{registry.get('prefix', ECR_ROOT)}{repo_name}"}
+    if registry.get('account'): params["registryId"] = registry['account']
+
+    # Regex per filtrare (inizia con N.N.N)
+    pattern = re.compile(r'^\d+\.\d+\.\d+.*')
+
+    versions = []
+    for page in ecr.get_paginator('describe_images').paginate(**params):
+        for img in page['imageDetails']:
+            for tag in img.get('imageTags', []):
+                if pattern.match(tag):
+                    versions.append({"versione": tag, "data_aggiunta": img['imagePushedAt']})
+    return versions
+
+def get_ecr_versions(project_name, registries=None):
     """
-    Recupera le versioni da ECR mappando il nome del progetto kustomization.
+    Recupera le versioni da tutti i registry configurati (REGISTRIES) in PARALLELO,
+    mappando il nome del progetto kustomization. La latenza è quella del registry più lento.
+    Le versioni sono unite per tag, con l'elenco dei registry che le contengono.
+    Returns: ({repo_name: versioni}, errore) - i dati restano disponibili se fallisce solo qualche registry.
     """
     # 1. Logica di mappatura nome: progetto-kustomization -> tgk-cdc/progetto
     repo_name = project_name.replace("-kustomization", "")
-    full_repo_path = f"{ECR_ROOT}{repo_name}"
-    
-    try:
-        # Inizializza sessione AWS
-        session = boto3.Session(profile_name='saml', region_name='eu-central-1')
-        ecr = session.client('ecr')
-        
-        # Recupera dettagli immagini
-        response = ecr.describe_images(repositoryName=full_repo_path)
-        
-        # Regex per filtrare (inizia con N.N.N)
-        pattern = re.compile(r'^\d+\.\d+\.\d+.*')
-        
-        versions = []
-        for img in response['imageDetails']:
-            if 'imageTags' in img:
-                for tag in img['imageTags']:
-                    if pattern.match(tag):
-                        versions.append({
-                            "versione": tag,
-                            "data_aggiunta": img['imagePushedAt']
-                        })
-        
-        # Ordina per data decrescente
-        versions.sort(key=lambda x: x['data_aggiunta'], reverse=True)
-        
-        # Formatta la data per la visualizzazione
+    registries = registries or REGISTRIES
+
+    def query(registry):
+        try: return registry['name'], _query_registry(registry, repo_name), None
+        except Exception as e: return registry['name'], [], str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(registries))) as executor:
+        results = list(executor.map(query, registries))
+
+    merged, errors = {}, []
+    for reg_name, versions, error in results:
+        if error: errors.append(f"{reg_name}: {error}")
         for v in versions:
-            v['data_aggiunta'] = v['data_aggiunta'].strftime('%Y-%m-%d %H:%M:%S')
-            
-        return {repo_name: versions}, None
-    
+            entry = merged.setdefault(v['versione'], {"versione": v['versione'], "data_aggiunta": v['data_aggiunta'], "registry": []})
+            entry['data_aggiunta'] = max(entry['data_aggiunta'], v['data_aggiunta'])
+            entry['registry'].append(reg_name)
+
+    error = "; ".join(errors) or None
+    if errors and len(errors) == len(registries): return None, error
+
+    # Ordina per data decrescente e formatta per la visualizzazione
+    versions = sorted(merged.values(), key=lambda x: x['data_aggiunta'], reverse=True)
+    for v in versions:
+        v['data_aggiunta'] = v['data_aggiunta'].strftime('%Y-%m-%d %H:%M:%S')
+        v['registry'] = ", ".join(v['registry'])
+
+    return {repo_name: versions}, error
+
+def get_ecr_versions_cached(project_name):
+    """
+    Come get_ecr_versions, ma condivisa tra le sessioni: richieste concorrenti
+    per lo stesso progetto fanno una sola chiamata ad ECR (risultato valido ECR_CACHE_TTL secondi).
+    """
+    def compute():
+        data, error = get_ecr_versions(project_name)
+        if data is None: raise RuntimeError(error)
+        return data, error
+    try:
+        return get_shared_cache().get_or_compute(f"ecr:{project_name}", compute, ttl=ECR_CACHE_TTL)
     except Exception as e:
-        return None, str(e)
\ No newline at end of file
+        return None, str(e)
+
+def ecr_repository_for_image(image_name, project_name=None):
+    """
+    Immagine ECR (host del registry incluso, se presente) a partire dal nome immagine di kustomize.
+    Es: 123.dkr.ecr.eu-central-1.amazonaws.com/tgk-cdc/app (host usato per account/regione), tgk-cdc/app
+    Un'immagine senza registry viene mappata come in get_ecr_versions (ECR_ROOT + progetto)
+    solo se è l'immagine del progetto: le altre (es. nginx) non sono nostre.
+    Restituisce None se l'immagine non è su ECR.
+    """
+    if not image_name: return None
+    image_name = str(image_name).split("@")[0]
+    if _split_image(image_name)[0]: return image_name
+    if image_name.startswith(ECR_ROOT): return image_name
+    project = project_name.replace('-kustomization', '') if project_name else None
+    if project and image_name == project:
+        return f"{ECR_ROOT}{project}"
+    return None
+
+def image_refs_from_overlay(content, project_name):
+    """Coppie (repository ECR, tag) referenziate da images[] di un overlay kustomize."""
+    try: data = YAML().load(content)
+    except Exception: return []
+    if not isinstance(data, dict): return []
+    refs = []
+    for img in data.get('images') or []:
+        if not isinstance(img, dict) or not img.get('newTag'): continue
+        repo = ecr_repository_for_image(img.get('newName') or img.get('name'), project_name)
+        if repo: refs.append((repo, str(img['newTag'])))
+    return refs
+
+_ECR_HOST_RE = re.compile(r'^(\d{12})\.dkr\.ecr\.([a-z0-9-]+)\.amazonaws\.com(\.cn)?$')
+
+def _split_image(image):
+    """'<acct>.dkr.ecr.<region>.amazonaws.com/tgk-cdc/app' -> (host, 'tgk-cdc/app'); senza registry: (None, image)."""
+    first, _, rest = image.partition("/")
+    if rest and _ECR_HOST_RE.match(first): return first, rest
+    return None, image
+
+def _registries_for_host(host):
+    """
+    Registry in cui cercare un'immagine: quelli configurati per account/regione del host,
+    oppure (host non configurato) uno derivato dal host con il profilo del primo registry.
+    Immagini senza host: tutti i registry ECR configurati.
+    """
+    ecr_registries = [r for r in REGISTRIES if r.get('type', 'ecr') == 'ecr']
+    match = _ECR_HOST_RE.match(host) if host else None
+    if not match: return ecr_registries
+    account, region = match.group(1), match.group(2)
+    configured = [r for r in ecr_registries if r.get('region') == region and r.get('account') in (None, account)]
+    if configured: return [{**r, "account": account} for r in configured]
+    base = ecr_registries[0] if ecr_registries else {}
+    return [{"name": host, "type": "ecr", "profile": base.get('profile'), "region": region, "account": account}]
+
+def _tags_in_registry(ecr, registry, repo, tags):
+    """Sottoinsieme di tags presente in repo su un registry (batch_get_image a blocchi)."""
+    found = set()
+    for i in range(0, len(tags), BATCH_GET_IMAGE_LIMIT):
+        chunk = tags[i:i + BATCH_GET_IMAGE_LIMIT]
+        params = {"repositoryName": repo, "imageIds": [{"imageTag": t} for t in chunk]}
+        if registry.get('account'): params["registryId"] = registry['account']
+        try: response = ecr.batch_get_image(**params)
+        except ecr.exceptions.RepositoryNotFoundException: continue
+        found |= {img['imageId'].get('imageTag') for img in response.get('images', [])}
+    return found
+
+def check_image_tags_exist(refs, client=None):
+    """
+    Verifica che i tag esistano su ECR con batch_get_image (imageIds a blocchi di
+    BATCH_GET_IMAGE_LIMIT). Un tag è presente se lo contiene almeno uno dei registry
+    dell'immagine (account/regione dal host, altrimenti tutti quelli in REGISTRIES).
+    Gli esiti restano in cache TAG_CHECK_TTL secondi, così validare molti ambienti costa poche chiamate.
+    refs: coppie (immagine, tag), immagine con o senza host del registry.
+    client: client ECR da usare per tutti i registry (es. uno stub moto nei test).
+    Returns: ({(immagine, tag): bool}, errore) - i tag non verificabili (registry irraggiungibili) mancano dal dict.
+    """
+    refs = set(refs)
+    results, to_check = {}, {}
+    now = time.time()
+    with _tag_cache_lock:
+        for image, tag in refs:
+            hit = _tag_cache.get((image, tag))
+            if hit and now - hit[1] <= TAG_CHECK_TTL: results[(image, tag)] = hit[0]
+            else: to_check.setdefault(image, []).append(tag)
+    if not to_check: return results, None
+
+    errors = []
+    for image, tags in to_check.items():
+        host, repo = _split_image(image)
+        found, failed = set(), False
+        for registry in _registries_for_host(host):
+            reg_key = (registry.get('profile'), registry.get('region'), registry.get('account'))
+            with _tag_cache_lock:
+                recent = None if client else _registry_errors.get(reg_key)
+            if recent and now - recent[1] <= TAG_CHECK_ERROR_TTL:
+                failed = True
+                errors.append(f"{registry.get('name')}: {recent[0]}")
+                continue
+            try:
+                ecr = client or _registry_client(registry)
+                found |= _tags_in_registry(ecr, registry, repo, [t for t in tags if t not in found])
+            except Exception as e:
+                failed = True
+                errors.append(f"{registry.get('name')}: {e}")
+                if not client:
+                    with _tag_cache_lock: _registry_errors[reg_key] = (str(e), now)
+            if len(found) == len(tags): break
+        for tag in tags:
+            # Non trovato ma con un registry irraggiungibile: esito sconosciuto, non "mancante"
+            if tag in found or not failed: results[(image, tag)] = tag in found
+
+    with _tag_cache_lock:
+        for key in [(i, t) for i, tags in to_check.items() for t in tags]:
+            if key in results: _tag_cache[key] = (results[key], now)
+    return results, "; ".join(dict.fromkeys(errors)) or None
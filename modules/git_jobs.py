@@ -0,0 +1,111 @@
+import os
+import time
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_HISTORY = 50  # job conclusi conservati per la UI
+
+_repo_locks = {}
+_repo_locks_guard = threading.Lock()
+
+def repo_lock(repo_path):
+    """
+    Lock di processo per un repository: ogni operazione git che scrive (pull, commit,
+    reset, clone) lo prende, così due operazioni sullo stesso repo non si sovrappongono mai.
+    Uso: with repo_lock(path): ...
+    """
+    key = os.path.realpath(repo_path)
+    with _repo_locks_guard:
+        return _repo_locks.setdefault(key, threading.Lock())
+
+class GitJobQueue:
+    """
+    Coda di job git: FIFO e seriale per singolo repository, parallela tra repository diversi.
+    Ogni job è un dict con stato (queued/running/done/failed), tempi ed esito; gli ultimi
+    MAX_HISTORY job conclusi restano consultabili.
+    """
+    def __init__(self, max_workers=8):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cdc-git")
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending = {}  # repo -> deque di job in attesa
+        self._active = {}   # id -> job non ancora concluso
+        self._history = deque(maxlen=MAX_HISTORY)
+
+    def submit(self, repo_path, label, fn, *args, on_done=None):
+        """
+        Accoda fn(*args) sul repo. fn deve restituire (ok, messaggio) come le funzioni di git_manager.
+        on_done(job) viene chiamato a job concluso (nel thread del worker).
+        """
+        key = os.path.realpath(repo_path)
+        job = {
+            "id": next(self._ids), "repo": os.path.basename(key), "label": label,
+            "status": "queued", "ok": None, "message": "",
+            "submitted_at": time.time(), "started_at": None, "finished_at": None,
+            "_call": (fn, args, on_done),
+        }
+        with self._lock:
+            self._active[job["id"]] = job
+            queue = self._pending.setdefault(key, deque())
+            queue.append(job)
+            start_worker = len(queue) == 1
+        if start_worker: self._executor.submit(self._drain, key)
+        return job["id"]
+
+    def _drain(self, key):
+        while True:
+            with self._lock:
+                job = self._pending[key][0]
+                call = job.pop("_call")
+            self._run(key, job, *call)
+            with self._lock:
+                queue = self._pending[key]
+                queue.popleft()
+                if not queue:
+                    del self._pending[key]
+                    return
+
+    def _run(self, key, job, fn, args, on_done):
+        with repo_lock(key):
+            with self._lock: job.update(status="running", started_at=time.time())
+            try:
+                result = fn(*args)
+                ok, message = result if isinstance(result, tuple) and len(result) == 2 else (True, str(result))
+            except Exception as e:
+                ok, message = False, str(e)
+        with self._lock:
+            job.update(status="done" if ok else "failed", ok=ok, message=message, finished_at=time.time())
+            self._active.pop(job["id"], None)
+            self._history.appendleft(job)
+        if on_done:
+            try: on_done(job)
+            except Exception as e: print(f"Errore callback job: {e}")
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._active.get(job_id) or next((j for j in self._history if j["id"] == job_id), None)
+            return self._public(job) if job else None
+
+    def active(self):
+        """Job in coda o in esecuzione, con la posizione nella coda del proprio repo."""
+        with self._lock:
+            jobs = []
+            for queue in self._pending.values():
+                for pos, job in enumerate(queue):
+                    jobs.append({**self._public(job), "position": pos})
+            return sorted(jobs, key=lambda j: j["id"])
+
+    def history(self):
+        with self._lock:
+            return [self._public(j) for j in self._history]
+
+    @staticmethod
+    def _public(job):
+        return {k: v for k, v in job.items() if not k.startswith("_")}
+
+_JOB_QUEUE = GitJobQueue()
+
+def get_job_queue():
+    return _JOB_QUEUE
@@ -3,7 +3,15 @@ import subprocess
 import streamlit as st
 import json
 import re
+import io
+import shutil
+import tarfile
+import tempfile
 from concurrent.futures import ThreadPoolExecutor
+from config import CHART_CACHE_DIR, OBJECT_CACHE_DIR
+from modules.git_jobs import repo_lock
+from modules.yaml_manager import parse_rule_fields
+from modules.profiler import profiled
 
 def check_app_updates(repo_path):
     """
@@ -29,42 +37,210 @@ def check_app_updates(repo_path):
         pass
     return False
 
+# Una sola connessione SSH per host riusata da ls-remote e pull (ControlMaster)
+SSH_CONTROL_PATH = os.path.join(tempfile.gettempdir(), "cdc-ssh-%C")
+
+def _git_env():
+    env = dict(os.environ)
+    if "GIT_SSH_COMMAND" not in env:
+        env["GIT_SSH_COMMAND"] = f"ssh -o ControlMaster=auto -o ControlPath={SSH_CONTROL_PATH} -o ControlPersist=120"
+    return env
+
+def _is_up_to_date(repo_full_path):
+    """
+    Pre-check economico: confronta l'upstream locale con l'head remoto (git ls-remote).
+    True solo se remoto == origin/<branch> e il branch locale non è indietro;
+    in ogni caso dubbio (niente upstream, errore di rete...) restituisce False e si fa il pull.
+    """
+    def git(*args, timeout=5):
+        res = subprocess.run(["git", "-C", repo_full_path, *args], capture_output=True, text=True,
+                             timeout=timeout, env=_git_env())
+        return res.stdout.strip() if res.returncode == 0 else None
+    try:
+        upstream = git("rev-parse", "--abbrev-ref", "--symbolic-full-name", "@{u}")
+        local_sha = git("rev-parse", "@{u}")
+        if not upstream or not local_sha or "/" not in upstream: return False
+        remote, branch = upstream.split("/", 1)
+        remote_out = git("ls-remote", remote, f"refs/heads/{branch}", timeout=15)
+        if not remote_out: return False
+        behind = git("rev-list", "--count", "HEAD..@{u}")
+        return remote_out.split()[0] == local_sha and behind == "0"
+    except Exception:
+        return False
+
 def _pull_single_repo(repo_full_path):
-    """Funzione helper per il pull parallelo"""
+    """Funzione helper per il sync parallelo: 'skipped' (già allineato), 'pulled' o 'failed'."""
     repo_name = os.path.basename(repo_full_path)
     try:
-        # Timeout breve per non bloccare tutto
-        res = subprocess.run(
-            ["git", "-C", repo_full_path, "pull"], 
-            capture_output=True, 
-            timeout=15, 
-            check=False
-        )
+        # Object store condiviso sparito: senza riparazione il pull fallirebbe per oggetti mancanti
+        if not repair_missing_alternates(repo_full_path): return repo_name, "failed"
+        if _is_up_to_date(repo_full_path): return repo_name, "skipped"
+        # Timeout breve per non bloccare tutto; il lock evita pull concorrenti a commit/reset sullo stesso repo
+        with repo_lock(repo_full_path):
+            res = subprocess.run(
+                ["git", "-C", repo_full_path, "pull"], 
+                capture_output=True, 
+                timeout=15, 
+                check=False,
+                env=_git_env()
+            )
         # Consideriamo successo solo se returncode è 0
-        return repo_name, (res.returncode == 0)
+        return repo_name, "pulled" if res.returncode == 0 else "failed"
     except: 
-        return repo_name, False
+        return repo_name, "failed"
 
-def git_pull_all(root_dir):
+def git_sync_all(root_dir):
     """
-    Esegue git pull su tutte le sottocartelle in PARALLELO e restituisce lo stato.
-    Returns: dict {repo_name: success_bool}
+    Sync di tutte le sottocartelle in PARALLELO: i repo già allineati al remoto
+    (pre-check con ls-remote) vengono saltati, solo gli altri ricevono git pull.
+    Returns: dict {repo_name: 'skipped' | 'pulled' | 'failed'}
     """
-    results = {}
-    if not os.path.exists(root_dir): return results
-    
+    if not os.path.exists(root_dir): return {}
     repos = [os.path.join(root_dir, f) for f in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, f))]
-    if not repos: return results
-
+    if not repos: return {}
     with ThreadPoolExecutor(max_workers=10) as executor:
-        # Mappa la funzione e raccogli i risultati
-        pull_results = list(executor.map(_pull_single_repo, repos))
-        
-    for name, success in pull_results:
-        results[name] = success
-        
-    return results
-    
+        return dict(executor.map(profiled(_pull_single_repo), repos))
+
+def _guess_chart_url(origin_url):
+    """Es: .../cdc-adapter-kustomization.git -> .../cdc-adapter-chart.git"""
+    if "kustomization" in origin_url:
+        return origin_url.replace("kustomization", "chart")
+    elif "-config" in origin_url:
+        return origin_url.replace("-config", "-chart")
+    # Fallback brutale: aggiunge -chart alla fine se non trova pattern
+    if origin_url.endswith(".git"):
+        return origin_url.replace(".git", "-chart.git")
+    return origin_url + "-chart"
+
+def _get_origin_url(repo_path):
+    res = subprocess.run(["git", "-C", repo_path, "remote", "get-url", "origin"], capture_output=True, text=True)
+    return res.stdout.strip() if res.returncode == 0 else None
+
+def _archive_chart_files(chart_url, ref, dest_dir):
+    """git archive --remote: scarica solo values.yaml/Chart.yaml (se il server lo consente)."""
+    res = subprocess.run(["git", "archive", f"--remote={chart_url}", "--format=tar", ref or "HEAD", "values.yaml", "Chart.yaml"],
+                         capture_output=True, timeout=30)
+    if res.returncode != 0: return False
+    with tarfile.open(fileobj=io.BytesIO(res.stdout)) as tar:
+        for member in tar.getmembers():
+            if member.isfile() and os.path.basename(member.name) in ("values.yaml", "Chart.yaml"):
+                with open(os.path.join(dest_dir, os.path.basename(member.name)), 'wb') as f:
+                    f.write(tar.extractfile(member).read())
+    return os.path.exists(os.path.join(dest_dir, "values.yaml"))
+
+def _sparse_chart_files(chart_url, ref, dest_dir, project_name):
+    """Clone parziale (depth 1, senza blob) + sparse checkout dei soli values.yaml/Chart.yaml."""
+    with tempfile.TemporaryDirectory() as tmp:
+        clone_cmd = ["git", "clone", "--depth", "1", "--filter=blob:none", "--no-checkout"]
+        if ref: clone_cmd += ["--branch", ref]
+        res = subprocess.run(clone_cmd + [chart_url, tmp], capture_output=True, text=True, timeout=60)
+        if res.returncode != 0: return False
+        subprocess.run(["git", "-C", tmp, "sparse-checkout", "set", "--no-cone",
+                        "/values.yaml", "/Chart.yaml", "/*/values.yaml", "/*/Chart.yaml"], capture_output=True, check=True)
+        subprocess.run(["git", "-C", tmp, "checkout"], capture_output=True, check=True, timeout=60)
+        # Stessi percorsi cercati da get_chart_values_content: root del repo o cartella del progetto
+        for sub in ("", project_name):
+            if os.path.exists(os.path.join(tmp, sub, "values.yaml")):
+                for name in ("values.yaml", "Chart.yaml"):
+                    src = os.path.join(tmp, sub, name)
+                    if os.path.exists(src): shutil.copy(src, os.path.join(dest_dir, name))
+                return True
+    return False
+
+def fetch_chart_values(root_dir, project_name, source_repo_folder, chart_version=None):
+    """
+    Recupera SOLO values.yaml (e Chart.yaml) del repo chart per la versione indicata,
+    senza clone completo: prima 'git archive --remote', poi clone sparse con filtro blob.
+    Il risultato resta in CHART_CACHE_DIR/<progetto>/<versione>/.
+    """
+    version_key = chart_version or "HEAD"
+    dest_dir = os.path.join(CHART_CACHE_DIR, project_name, version_key)
+    if os.path.exists(os.path.join(dest_dir, "values.yaml")):
+        return True, f"values.yaml {version_key} già in cache."
+
+    origin_url = _get_origin_url(os.path.join(root_dir, source_repo_folder))
+    if not origin_url: return False, "Impossibile leggere remote origin del repo corrente."
+    chart_url = _guess_chart_url(origin_url)
+
+    # Convenzioni di tag possibili per la versione chart; senza versione si usa il branch di default
+    refs = [chart_version, f"v{chart_version}", f"{project_name}-{chart_version}"] if chart_version else [None]
+    os.makedirs(dest_dir, exist_ok=True)
+    for ref in refs:
+        try:
+            if _archive_chart_files(chart_url, ref, dest_dir) or _sparse_chart_files(chart_url, ref, dest_dir, project_name):
+                return True, f"values.yaml {version_key} scaricato da {chart_url}"
+        except Exception:
+            continue
+    shutil.rmtree(dest_dir, ignore_errors=True)
+    return False, f"values.yaml non recuperabile da {chart_url} ({version_key})."
+
+# --- OBJECT STORE CONDIVISO (git alternates) ---
+def _cache_namespace(url):
+    """Namespace dei ref di un remote nell'object store: 'git@host:a/b.git' -> 'host_a_b'."""
+    name = re.sub(r'^(\w+://)?([^@/]+@)?', '', url).removesuffix('.git')
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', name).strip('_')
+
+def _seed_object_cache(url):
+    """
+    Scarica gli oggetti di url nell'object store condiviso (ognuno nel proprio namespace refs/remotes/<ns>/*).
+    Dopo un force-push il fetch sposta il ref e gli oggetti vecchi non sono più raggiungibili nello store,
+    ma i clone possono ancora usarli: per questo nello store gc automatico e prune sono disattivati.
+    Returns: path assoluto dello store, o None se disattivato/non disponibile (clone normale).
+    """
+    if not OBJECT_CACHE_DIR: return None
+    cache = os.path.abspath(OBJECT_CACHE_DIR)
+    try:
+        with repo_lock(cache):
+            if not os.path.exists(os.path.join(cache, "HEAD")):
+                subprocess.run(["git", "init", "-q", "--bare", cache], capture_output=True, check=True)
+            # Anche sugli store già esistenti, creati prima di questa configurazione
+            for key, value in (("gc.auto", "0"), ("gc.pruneExpire", "never")):
+                subprocess.run(["git", "-C", cache, "config", key, value], capture_output=True, check=True)
+            ns = _cache_namespace(url)
+            subprocess.run(["git", "-C", cache, "fetch", "-q", "--no-tags", url, f"+refs/heads/*:refs/remotes/{ns}/*"],
+                           capture_output=True, check=True, env=_git_env())
+        return cache
+    except Exception:
+        return None
+
+def _clone_repo(url, target_name, cwd):
+    """git clone che prende in prestito gli oggetti dallo store condiviso (--reference-if-able)."""
+    cmd = ["git", "clone"]
+    cache = _seed_object_cache(url)
+    if cache: cmd += ["--reference-if-able", cache]
+    return subprocess.run(cmd + [url, target_name], cwd=cwd, capture_output=True, text=True, check=True, env=_git_env())
+
+def _alternates_file(repo_path):
+    # Controllo solo su filesystem (nessun subprocess): viene fatto a ogni giro di sync
+    return os.path.join(repo_path, ".git", "objects", "info", "alternates")
+
+def repair_missing_alternates(repo_path):
+    """
+    Se l'object store referenziato non esiste più (cancellato/spostato) il repo non ha più
+    gli oggetti clonati: si toglie l'alternates e si riscaricano gli oggetti dal remote.
+    Returns: True se il repo è integro (o è stato riparato).
+    """
+    alt = _alternates_file(repo_path)
+    if not os.path.exists(alt): return True
+    with open(alt, 'r') as f: stores = [l.strip() for l in f if l.strip()]
+    if all(os.path.isdir(p) for p in stores): return True
+    with repo_lock(repo_path):
+        os.remove(alt)
+        res = subprocess.run(["git", "-C", repo_path, "fetch", "-q", "--refetch"], capture_output=True, env=_git_env())
+    return res.returncode == 0
+
+def dissociate_repo(repo_path):
+    """Rende il repo indipendente dallo store condiviso (copia locale degli oggetti in prestito)."""
+    alt = _alternates_file(repo_path)
+    if not os.path.exists(alt): return True, "Repo già indipendente"
+    try:
+        with repo_lock(repo_path):
+            subprocess.run(["git", "-C", repo_path, "repack", "-a", "-d", "-q"], capture_output=True, text=True, check=True)
+            os.remove(alt)
+        return True, "Oggetti copiati nel repo, alternates rimosso"
+    except subprocess.CalledProcessError as e:
+        return False, f"Errore repack: {e.stderr.strip()}"
+
 def git_clone_related_chart(root_dir, project_name, source_repo_folder):
     """
     Cerca di indovinare l'URL del repo Chart basandosi sul repo corrente e lo clona.
@@ -83,17 +259,7 @@ def git_clone_related_chart(root_dir, project_name, source_repo_folder):
         return False, "Impossibile leggere remote origin del repo corrente."
 
     # 2. Calcola URL del Chart (euristica: sostituisce kustomization con chart)
-    # Es: cdc-adapter-kustomization -> cdc-adapter-chart
-    if "kustomization" in origin_url:
-        chart_url = origin_url.replace("kustomization", "chart")
-    elif "-config" in origin_url:
-        chart_url = origin_url.replace("-config", "-chart")
-    else:
-        # Fallback brutale: aggiunge -chart alla fine se non trova pattern
-        if origin_url.endswith(".git"):
-            chart_url = origin_url.replace(".git", "-chart.git")
-        else:
-            chart_url = origin_url + "-chart"
+    chart_url = _guess_chart_url(origin_url)
 
     # 3. Nome cartella destinazione
     # Cerchiamo di mantenere lo standard: {project}-chart
@@ -105,7 +271,7 @@ def git_clone_related_chart(root_dir, project_name, source_repo_folder):
 
     # 4. Clona
     try:
-        subprocess.run(["git", "clone", chart_url, target_folder_name], cwd=root_dir, capture_output=True, check=True)
+        _clone_repo(chart_url, target_folder_name, root_dir)
         return True, f"Chart clonata con successo in {target_folder_name}!"
     except subprocess.CalledProcessError as e:
         return False, f"Fallito clone di {chart_url}.\nErrore: {e.stderr.strip()}"
@@ -199,9 +365,12 @@ def git_clone_from_file(destination_dir, projects_file_path):
         elif match_virt:
             source_folder = match_virt.group(1).strip()
             virtual_name = match_virt.group(2).strip()
-            yaml_path = match_virt.group(3).strip()
+            # WITH accetta più campi: 'tag=copyTool.imageTag|copyTool.tag, images[*].newTag'
+            fields = parse_rule_fields(match_virt.group(3).strip())
             repo_config["virtual"] = [x for x in repo_config["virtual"] if x['name'] != virtual_name]
-            repo_config["virtual"].append({"name": virtual_name, "source": source_folder, "path": yaml_path})
+            # 'path' (primo campo) resta per compatibilità con le configurazioni precedenti
+            repo_config["virtual"].append({"name": virtual_name, "source": source_folder,
+                                           "path": fields[0]["path"] if fields else "", "fields": fields})
             log_msgs.append(f"👻 Virtual: '{virtual_name}' su '{source_folder}'")
             is_virt = True
         elif " as " in line:
@@ -217,7 +386,7 @@ def git_clone_from_file(destination_dir, projects_file_path):
                 log_msgs.append(f"⚠️ {repo_name}: Esistente.")
             else:
                 try:
-                    subprocess.run(["git", "clone", url, repo_name], cwd=destination_dir, capture_output=True, check=True)
+                    _clone_repo(url, repo_name, destination_dir)
                     log_msgs.append(f"✅ {repo_name}: Clonato.")
                 except Exception as e:
                     log_msgs.append(f"❌ {repo_name}: Errore Clone.")
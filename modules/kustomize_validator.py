@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Risultati per (repo, env, tree hash): un ambiente non modificato non viene mai ricompilato
+_build_cache = {}
+_build_cache_lock = threading.Lock()
+
+def env_tree_hash(repo_path, env):
+    """
+    Hash git dell'albero della cartella env così com'è su disco (modifiche non committate incluse).
+    Usa un index temporaneo, quindi non tocca lo staging dell'utente.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        git_env = {**os.environ, "GIT_INDEX_FILE": os.path.join(tmp, "index")}
+        try:
+            subprocess.run(["git", "-C", repo_path, "read-tree", "HEAD"], env=git_env, capture_output=True, check=True)
+            subprocess.run(["git", "-C", repo_path, "add", "-A", "--", env], env=git_env, capture_output=True, check=True)
+            res = subprocess.run(["git", "-C", repo_path, "write-tree", f"--prefix={env}/"],
+                                 env=git_env, capture_output=True, text=True, check=True)
+            return res.stdout.strip()
+        except subprocess.CalledProcessError:
+            return None
+
+def touched_envs(repo_path):
+    """Ambienti (cartelle con overlays/) con modifiche locali o commit non ancora pushati."""
+    paths = []
+    try:
+        res = subprocess.run(["git", "-C", repo_path, "status", "--porcelain"], capture_output=True, text=True)
+        for line in res.stdout.splitlines():
+            paths.append(line[3:].split(" -> ")[-1].strip('"'))
+        res = subprocess.run(["git", "-C", repo_path, "diff", "--name-only", "@{u}..HEAD"], capture_output=True, text=True)
+        if res.returncode == 0: paths += res.stdout.splitlines()
+    except Exception:
+        return []
+    envs = {p.split("/")[0] for p in paths if "/" in p}
+    return sorted(e for e in envs if os.path.isdir(os.path.join(repo_path, e, "overlays")))
+
+def _build_env(repo_path, env):
+    # Build su una copia temporanea: --enable-helm scarica i chart in <env>/base/charts/,
+    # che nel repo vero finirebbero nel commit (git add .) e cambierebbero il tree hash
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            work = os.path.join(tmp, os.path.basename(os.path.abspath(repo_path)))
+            shutil.copytree(repo_path, work, ignore=shutil.ignore_patterns(".git"), symlinks=True)
+            res = subprocess.run(["kustomize", "build", "--enable-helm", os.path.join(work, env, "overlays")],
+                                 capture_output=True, text=True, timeout=120)
+        if res.returncode == 0: return True, ""
+        return False, (res.stderr.strip() or res.stdout.strip()).replace(work, repo_path)
+    except subprocess.TimeoutExpired:
+        return False, "Timeout kustomize build"
+    except Exception as e:
+        return False, str(e)
+
+def _validate_env(repo_path, env):
+    tree = env_tree_hash(repo_path, env)
+    key = (os.path.abspath(repo_path), env, tree)
+    if tree:
+        with _build_cache_lock:
+            if key in _build_cache: return _build_cache[key]
+    result = _build_env(repo_path, env)
+    if tree:
+        with _build_cache_lock: _build_cache[key] = result
+    return result
+
+def validate_envs(repo_path, envs, max_workers=4):
+    """
+    Esegue 'kustomize build --enable-helm' sugli ambienti indicati in PARALLELO.
+    Se kustomize o helm non sono installati, lascia passare (fallback come per terraform).
+    Returns: dict {env: (ok, errore)}
+    """
+    if not envs: return {}
+    if not shutil.which("kustomize"):
+        return {env: (True, "kustomize CLI non trovato, validazione saltata.") for env in envs}
+    if not shutil.which("helm"):
+        return {env: (True, "helm CLI non trovato (richiesto da --enable-helm), validazione saltata.") for env in envs}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda e: _validate_env(repo_path, e), envs))
+    return dict(zip(envs, results))
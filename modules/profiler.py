@@ -0,0 +1,97 @@
+import os
+import time
+import cProfile
+import pstats
+import tempfile
+import threading
+import contextvars
+import pandas as pd
+
+# Profiler del rerun della sessione: impostato nel thread dello script, quindi i thread
+# condivisi (scansione in background, scheduler, API, coda git) non lo vedono mai
+_current = contextvars.ContextVar("cdc_rerun_profiler", default=None)
+
+class RerunProfiler:
+    """
+    Profiler deterministico (cProfile) per un singolo rerun di main.py.
+    Oltre al thread dello script profila i task che questo sottomette ai worker avvolti con
+    profiled(): ognuno ha un cProfile che vive solo per la durata del task. I calcoli condivisi
+    (scansione in background, scheduler, API, coda git) non sono attribuiti a nessuna sessione.
+    Il tempo è wall-clock, quindi le attese su subprocess (git) compaiono nel cumulativo.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles = []
+        self._main = cProfile.Profile()
+        self.started_at = None
+        self.elapsed = None
+        self._token = None
+
+    def _add(self, profile):
+        with self._lock: self._profiles.append(profile)
+
+    def start(self):
+        """
+        Returns: False se il profiling non può partire: da Python 3.12 un solo cProfile
+        alla volta per processo, e potrebbe essere già attivo quello di un'altra sessione.
+        """
+        try: self._main.enable()
+        except ValueError: return False
+        self.started_at = time.perf_counter()
+        self._token = _current.set(self)
+        return True
+
+    def stop(self):
+        """Ferma il profiling e restituisce i pstats.Stats aggregati (None se non era attivo)."""
+        if self.started_at is None or self.elapsed is not None: return None
+        self._main.disable()
+        # Da un altro thread (profiler rimasto attivo da un rerun interrotto) il token non vale
+        try: _current.reset(self._token)
+        except ValueError: pass
+        self.elapsed = time.perf_counter() - self.started_at
+        stats = pstats.Stats(self._main)
+        with self._lock: profiles = list(self._profiles)
+        for profile in profiles:
+            try: stats.add(profile)
+            except (TypeError, ValueError): pass  # task senza dati
+        return stats
+
+def profiled(fn):
+    """
+    Da usare sui task sottomessi ai worker, al momento della submit: se il rerun della sessione
+    che sottomette è in profiling il task viene eseguito sotto un cProfile proprio, disattivato
+    a fine task nello stesso thread.
+    """
+    profiler = _current.get()
+    if profiler is None: return fn
+    def run(*args, **kwargs):
+        profile = cProfile.Profile()
+        # Da Python 3.12 il profiler del rerun copre già tutti i thread: un secondo cProfile non parte
+        try: profile.enable()
+        except ValueError: return fn(*args, **kwargs)
+        try: return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            profiler._add(profile)
+    return run
+
+def profiling_requested(query_params, settings):
+    """Attivo con ?profile=1 nell'URL oppure con "profile_reruns": true nei settings."""
+    return query_params.get("profile") in ("1", "true") or bool(settings.get("profile_reruns"))
+
+def hot_functions(stats, limit=40):
+    """Tabella delle funzioni più costose, ordinata per tempo cumulativo."""
+    rows = []
+    for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+        location = f"{os.path.basename(filename)}:{line}" if line else filename
+        rows.append({"Funzione": func, "File": location, "Chiamate": nc,
+                     "Tempo proprio (ms)": round(tt * 1000, 2), "Cumulativo (ms)": round(ct * 1000, 2)})
+    df = pd.DataFrame(rows, columns=["Funzione", "File", "Chiamate", "Tempo proprio (ms)", "Cumulativo (ms)"])
+    return df.sort_values("Cumulativo (ms)", ascending=False).head(limit)
+
+def stats_bytes(stats):
+    """File .pstats (per snakeviz, gprof2dot, flameprof...) come bytes da scaricare."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rerun.pstats")
+        stats.dump_stats(path)
+        with open(path, 'rb') as f: return f.read()
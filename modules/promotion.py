@@ -0,0 +1,140 @@
+import os
+import copy
+from io import StringIO
+from modules.yaml_manager import load_yaml_cached, _new_yaml, is_valid_yaml
+from modules.terraform_manager import set_tf_version
+
+# Campi promossi di default; i valuesInline (spesso specifici per ambiente) vanno scelti a mano
+DEFAULT_SELECTED_KINDS = {"Tag", "Chart", "TF"}
+
+def _flatten(node, prefix=()):
+    """Foglie di un mapping come (path, valore). Le liste sono trattate come valori."""
+    if isinstance(node, dict) and node:
+        for key, value in node.items():
+            yield from _flatten(value, prefix + (key,))
+    else:
+        yield prefix, node
+
+def _by_name(items):
+    """Lista di mapping indicizzata per 'name' (images, helmCharts)."""
+    if not isinstance(items, list): return {}
+    return {item.get('name'): item for item in items if isinstance(item, dict) and item.get('name')}
+
+def _label(path):
+    parts = []
+    for p in path:
+        if isinstance(p, tuple): parts[-1] += f"[{p[0]}={p[1]}]"
+        else: parts.append(str(p))
+    return ".".join(parts)
+
+def _diff_kustomize(repo_folder, project, src_dir, dst_dir):
+    items = []
+    files = {
+        "overlays": (os.path.join(src_dir, "overlays", "kustomization.yaml"), os.path.join(dst_dir, "overlays", "kustomization.yaml")),
+        "base": (os.path.join(src_dir, "base", "kustomization.yaml"), os.path.join(dst_dir, "base", "kustomization.yaml")),
+    }
+
+    def add(kind, dst_file, path, old, new, image=None):
+        items.append({"Progetto": project, "Tipo": "Kustomize", "Campo": _label(path), "Da": old, "A": new,
+                      "Kind": kind, "File": dst_file, "Path": path, "Repo": repo_folder, "Image": image})
+
+    src_ov, dst_ov = [load_yaml_cached(p) for p in files["overlays"]]
+    if src_ov and dst_ov:
+        dst_images = _by_name(dst_ov.get('images'))
+        for name, img in _by_name(src_ov.get('images')).items():
+            target = dst_images.get(name)
+            if target is None: continue
+            for field in ("newTag", "newName"):
+                if field in img and img.get(field) != target.get(field):
+                    add("Tag" if field == "newTag" else "Image", files["overlays"][1],
+                        ("images", ("name", name), field), target.get(field), img.get(field),
+                        image=img.get('newName') or name)
+
+    src_ba, dst_ba = [load_yaml_cached(p) for p in files["base"]]
+    if src_ba and dst_ba:
+        dst_charts = _by_name(dst_ba.get('helmCharts'))
+        for name, chart in _by_name(src_ba.get('helmCharts')).items():
+            target = dst_charts.get(name)
+            if target is None: continue
+            if 'version' in chart and chart.get('version') != target.get('version'):
+                add("Chart", files["base"][1], ("helmCharts", ("name", name), "version"), target.get('version'), chart.get('version'))
+            dst_values = dict(_flatten(target.get('valuesInline') or {}))
+            for path, value in _flatten(chart.get('valuesInline') or {}):
+                if not path: continue
+                if path not in dst_values or dst_values[path] != value:
+                    add("Values", files["base"][1], ("helmCharts", ("name", name), "valuesInline") + path,
+                        dst_values.get(path), value)
+    return items
+
+def build_promotion_plan(root_dir, df, source_env, target_env):
+    """
+    Piano di promozione source_env -> target_env per tutti i progetti in un solo passaggio:
+    tag immagini, versioni chart, chiavi valuesInline (Kustomize) e ref Terraform.
+    I documenti YAML sono quelli già parsati dalla scansione (load_yaml_cached).
+    """
+    plan = []
+    if df.empty: return plan
+
+    kust = df[(df['Tipo'] == "Kustomize") & (~df['Virtual'])]
+    for repo_folder, project in kust[['RepoFolder', 'Progetto']].drop_duplicates().itertuples(index=False):
+        src_dir = os.path.join(root_dir, repo_folder, source_env)
+        dst_dir = os.path.join(root_dir, repo_folder, target_env)
+        if os.path.isdir(src_dir) and os.path.isdir(dst_dir):
+            plan += _diff_kustomize(repo_folder, project, src_dir, dst_dir)
+
+    tf = df[df['Tipo'] == "Terraform"]
+    src_tf = tf[tf['Ambiente'] == source_env].drop_duplicates('Progetto').set_index('Progetto')
+    dst_tf = tf[tf['Ambiente'] == target_env]
+    for row in dst_tf.itertuples(index=False):
+        if row.Progetto not in src_tf.index: continue
+        new, old = src_tf.loc[row.Progetto, 'TfVersion'], row.TfVersion
+        if not isinstance(new, str) or new in ("Not Found", "Err") or new == old: continue
+        plan.append({"Progetto": row.Progetto, "Tipo": "Terraform", "Campo": "source ?ref=tags/", "Da": old, "A": new,
+                     "Kind": "TF", "File": row.FilePath, "Path": None, "Repo": row.RepoFolder})
+    return plan
+
+def _set_path(doc, path, value):
+    node = doc
+    for i, key in enumerate(path[:-1]):
+        if isinstance(key, tuple):
+            field, name = key
+            node = next(item for item in node if isinstance(item, dict) and item.get(field) == name)
+        else:
+            if key not in node or node[key] is None:
+                node[key] = {}
+            node = node[key]
+    node[path[-1]] = copy.deepcopy(value)
+
+def apply_promotion_plan(items):
+    """
+    Applica le voci selezionate in un'unica fase di scrittura: prima si calcolano e
+    validano tutti i nuovi contenuti, poi si scrivono i file. Se una voce fallisce non si scrive nulla.
+    Returns: (ok, messaggio, lista file modificati)
+    """
+    yaml_items, tf_items = {}, {}
+    for item in items:
+        bucket = tf_items if item['Kind'] == "TF" else yaml_items
+        bucket.setdefault(item['File'], []).append(item)
+
+    new_contents = {}
+    try:
+        for path, file_items in yaml_items.items():
+            y = _new_yaml()
+            with open(path, 'r') as f: doc = y.load(f)
+            for item in file_items: _set_path(doc, item['Path'], item['A'])
+            buf = StringIO()
+            y.dump(doc, buf)
+            ok, err = is_valid_yaml(buf.getvalue())
+            if not ok: return False, f"{path}: {err}", []
+            new_contents[path] = buf.getvalue()
+        for path, file_items in tf_items.items():
+            with open(path, 'r') as f: ok, content = set_tf_version(f.read(), file_items[-1]['A'])
+            if not ok: return False, f"{path}: {content}", []
+            new_contents[path] = content
+    except Exception as e:
+        return False, f"Errore preparazione piano: {e}", []
+
+    for path, content in new_contents.items():
+        with open(path, 'w') as f: f.write(content)
+    changed = list(new_contents)
+    return True, f"✅ Piano applicato su {len(changed)} file", changed
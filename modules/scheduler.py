@@ -0,0 +1,133 @@
+import os
+import time
+import threading
+import subprocess
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from modules.git_manager import git_sync_all, check_app_updates
+from modules.shared_cache import get_shared_cache
+from modules.snapshot import save_snapshot, load_snapshot_meta
+
+DEFAULT_REFRESH_INTERVAL = 300  # secondi
+
+def _repo_head(repo_path):
+    """Restituisce lo SHA di HEAD (None se non è un repo git)."""
+    try:
+        res = subprocess.run(["git", "-C", repo_path, "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5)
+        if res.returncode == 0: return res.stdout.strip()
+    except Exception: pass
+    return None
+
+def _repo_heads(root_dir):
+    if not os.path.exists(root_dir): return {}
+    names = [f for f in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, f))]
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        heads = list(executor.map(lambda n: _repo_head(os.path.join(root_dir, n)), names))
+    return dict(zip(names, heads))
+
+class RefreshScheduler:
+    """
+    Thread in background (uno per processo) che esegue periodicamente
+    il sync di ROOT_DIR (pull solo dei repo non allineati) e il check aggiornamenti dell'app.
+    La pagina legge solo l'ultimo stato noto tramite snapshot().
+    Più "Pull All" concorrenti (anche da sessioni diverse) confluiscono in un unico giro.
+    """
+    def __init__(self, root_dir, app_dir, interval=DEFAULT_REFRESH_INTERVAL):
+        self.root_dir = root_dir
+        self.app_dir = app_dir
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._triggered = False  # risveglio con sync; senza, il risveglio ricalcola solo la scadenza
+
+        # Partenza dall'ultimo stato noto (snapshot), finché il primo giro non termina
+        meta = load_snapshot_meta(root_dir)
+        self.pull_status = meta.get("pull_status", {})
+        self.last_synced = meta.get("last_synced", {})
+        # HEAD attuali come riferimento: il primo giro invalida la scansione solo se porta commit nuovi
+        self.heads = _repo_heads(root_dir)
+        self.sync_results = {}  # repo -> 'skipped' | 'pulled' | 'failed' (ultimo giro)
+        self.app_update_available = False
+        self.last_run = None
+        self.last_error = None
+        self.running = False
+        # Incrementato solo quando i dati su disco cambiano (nuovi commit o esito pull diverso)
+        self.generation = 0
+
+        self._thread = threading.Thread(target=self._loop, name="cdc-refresh", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            started = time.monotonic()
+            self.run_once()
+            # Attesa fino a started + interval (riletto a ogni risveglio: set_interval sposta la scadenza)
+            while True:
+                remaining = started + self.interval - time.monotonic()
+                if remaining <= 0: break
+                self._wake.wait(remaining)
+                with self._lock:
+                    self._wake.clear()
+                    triggered, self._triggered = self._triggered, False
+                if triggered: break
+
+    def run_once(self):
+        self.running = True
+        try:
+            results = git_sync_all(self.root_dir)
+            status = {repo: result != "failed" for repo, result in results.items()}
+            heads = _repo_heads(self.root_dir)
+            update = check_app_updates(self.app_dir)
+            now = time.time()
+            with self._lock:
+                changed = status != self.pull_status or heads != self.heads
+                self.pull_status = status
+                self.heads = heads
+                self.sync_results = results
+                for repo, ok in status.items():
+                    if ok: self.last_synced[repo] = now
+                self.app_update_available = update
+                self.last_run = now
+                self.last_error = None
+                if changed: self.generation += 1
+            save_snapshot(self.root_dir, pull_status=status, last_synced=dict(self.last_synced))
+            # I dati su disco sono cambiati: la scansione condivisa va rifatta per tutte le sessioni
+            if changed: get_shared_cache().invalidate(f"scan:{self.root_dir}")
+        except Exception as e:
+            self.last_error = str(e)
+        finally:
+            self.running = False
+
+    def trigger(self):
+        """Forza un refresh immediato (es. bottone Pull All)."""
+        with self._lock:
+            self._triggered = True
+            self._wake.set()
+
+    def set_interval(self, seconds):
+        """Nuovo intervallo, contato dall'ultimo giro: non avvia un sync (solo se è già scaduto)."""
+        seconds = max(30, int(seconds))
+        if seconds != self.interval:
+            self.interval = seconds
+            self._wake.set()
+
+    def set_app_update_available(self, value):
+        with self._lock: self.app_update_available = value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pull_status": dict(self.pull_status),
+                "last_synced": dict(self.last_synced),
+                "sync_counts": {k: sum(1 for r in self.sync_results.values() if r == k) for k in ("pulled", "skipped", "failed")},
+                "app_update_available": self.app_update_available,
+                "last_run": self.last_run,
+                "last_error": self.last_error,
+                "running": self.running,
+                "generation": self.generation,
+            }
+
+@st.cache_resource(show_spinner=False)
+def get_scheduler(root_dir, app_dir):
+    """Uno scheduler condiviso da tutte le sessioni per la stessa ROOT_DIR."""
+    return RefreshScheduler(root_dir, app_dir)
@@ -0,0 +1,106 @@
+import time
+import threading
+
+class _Flight:
+    """Calcolo in corso per una chiave: chi arriva dopo aspetta questo."""
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.aborted = False  # leader uscito con un BaseException (rerun, stop, KeyboardInterrupt)
+
+class SharedCache:
+    """
+    Cache condivisa a livello di processo (tutte le sessioni Streamlit).
+    - get_or_compute ha semantica single-flight: richieste concorrenti per la
+      stessa chiave attendono un unico calcolo invece di duplicarlo.
+    - invalidate incrementa 'generation', così ogni sessione sa di dover rileggere.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}   # key -> (value, timestamp)
+        self._inflight = {}  # key -> _Flight
+        self.generation = 0
+
+    def get(self, key, ttl=None):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None: return None
+        value, ts = entry
+        if ttl is not None and time.time() - ts > ttl: return None
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+
+    def is_inflight(self, key):
+        with self._lock:
+            return key in self._inflight
+
+    def get_or_compute(self, key, fn, ttl=None):
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and (ttl is None or time.time() - entry[1] <= ttl):
+                    return entry[0]
+                flight = self._inflight.get(key)
+                is_leader = flight is None
+                if is_leader:
+                    flight = _Flight()
+                    self._inflight[key] = flight
+                start_generation = self.generation
+
+            if is_leader: return self._lead(key, flight, fn, start_generation)
+            flight.event.wait()
+            # Leader interrotto senza un errore del calcolo (es. rerun/stop della sua sessione Streamlit):
+            # non c'è un risultato da condividere, si riprova (e uno dei follower diventa leader)
+            if flight.aborted: continue
+            if flight.error is not None: raise flight.error
+            return flight.result
+
+    def compute_in_background(self, key, fn, name=None):
+        """
+        Come get_or_compute ma in un thread daemon, senza attendere. Il calcolo risulta in corso
+        (is_inflight) già al ritorno. Non fa nulla se la chiave è in cache o già in calcolo.
+        """
+        with self._lock:
+            if key in self._entries or key in self._inflight: return
+            flight = _Flight()
+            self._inflight[key] = flight
+            start_generation = self.generation
+        def run():
+            try: self._lead(key, flight, fn, start_generation)
+            except Exception as e: print(f"Errore calcolo {key}: {e}")
+        threading.Thread(target=run, name=name, daemon=True).start()
+
+    def _lead(self, key, flight, fn, start_generation):
+        try:
+            flight.result = fn()
+            with self._lock:
+                # Se nel frattempo è arrivata un'invalidazione il risultato è già vecchio: non lo salviamo
+                if self.generation == start_generation:
+                    self._entries[key] = (flight.result, time.time())
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        except BaseException:
+            flight.aborted = True
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def invalidate(self, prefix=""):
+        """Rimuove le chiavi che iniziano con prefix (tutte se vuoto) e notifica le sessioni."""
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+            self.generation += 1
+
+_SHARED_CACHE = SharedCache()
+
+def get_shared_cache():
+    return _SHARED_CACHE
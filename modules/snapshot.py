@@ -0,0 +1,58 @@
+import os
+import json
+import time
+import threading
+import pandas as pd
+
+# Ultima matrice calcolata + stato pull/sync, per una partenza istantanea della pagina
+SNAPSHOT_DATA = os.path.join(".cdc_config", "snapshot.parquet")
+SNAPSHOT_META = os.path.join(".cdc_config", "snapshot.json")
+
+_snapshot_lock = threading.Lock()
+
+def _read_meta():
+    if os.path.exists(SNAPSHOT_META):
+        try:
+            with open(SNAPSHOT_META, 'r') as f: return json.load(f)
+        except: pass
+    return {}
+
+def _atomic_write(path, write_fn):
+    tmp = f"{path}.tmp"
+    write_fn(tmp)
+    os.replace(tmp, path)
+
+def save_snapshot(root_dir, df=None, pull_status=None, last_synced=None):
+    """
+    Aggiorna lo snapshot (Parquet per la matrice, JSON per i metadati).
+    Si possono passare solo i pezzi disponibili: gli altri restano quelli salvati prima.
+    """
+    with _snapshot_lock:
+        try:
+            os.makedirs(os.path.dirname(SNAPSHOT_DATA), exist_ok=True)
+            meta = _read_meta()
+            if meta.get("root_dir") != root_dir: meta = {"root_dir": root_dir}
+            if df is not None:
+                _atomic_write(SNAPSHOT_DATA, lambda p: df.to_parquet(p, index=False))
+                meta["saved_at"] = time.time()
+            if pull_status is not None: meta["pull_status"] = pull_status
+            if last_synced is not None: meta["last_synced"] = last_synced
+
+            def write_meta(path):
+                with open(path, 'w') as f: json.dump(meta, f, indent=2)
+            _atomic_write(SNAPSHOT_META, write_meta)
+        except Exception as e:
+            print(f"Errore snapshot: {e}")
+
+def load_snapshot_meta(root_dir):
+    meta = _read_meta()
+    return meta if meta.get("root_dir") == root_dir else {}
+
+def load_snapshot(root_dir):
+    """Returns: (DataFrame, metadati) dell'ultimo snapshot per root_dir, oppure (None, {})."""
+    meta = load_snapshot_meta(root_dir)
+    if not meta.get("saved_at") or not os.path.exists(SNAPSHOT_DATA): return None, {}
+    try:
+        return pd.read_parquet(SNAPSHOT_DATA), meta
+    except Exception:
+        return None, {}
@@ -64,6 +64,27 @@ def get_tf_version(file_path):
     except Exception:
         return "Err"
 
+def set_tf_version(content, new_version):
+    """
+    Contenuto di main.tf con la versione sostituita (senza scrivere su disco).
+    Returns: (ok, nuovo contenuto o messaggio di errore)
+    """
+    # Regex per la sostituzione
+    pattern = r'(source\s*=\s*".*\?ref=tags\/)([^"]*)(")'
+
+    # Verifica se il pattern esiste prima di provare a sostituire
+    if not re.search(pattern, content):
+        return False, "Pattern 'source ... ?ref=tags/...' non trovato nel file."
+
+    # Sostituisce il gruppo 2 (vecchia versione) con new_version
+    # \1 è la prima parte (source = "...tags/), \3 è la virgoletta finale
+    new_content = re.sub(pattern, fr'\g<1>{new_version}\g<3>', content)
+
+    # Aggiunge newline finale se manca (best practice)
+    if not new_content.endswith('\n'):
+        new_content += '\n'
+    return True, new_content
+
 def update_tf_version(file_path, new_version):
     """
     Aggiorna la versione nel file main.tf usando regex.
@@ -75,20 +96,8 @@ def update_tf_version(file_path, new_version):
         with open(file_path, 'r') as f:
             content = f.read()
 
-        # Regex per la sostituzione
-        pattern = r'(source\s*=\s*".*\?ref=tags\/)([^"]*)(")'
-        
-        # Verifica se il pattern esiste prima di provare a sostituire
-        if not re.search(pattern, content):
-            return False, "Pattern 'source ... ?ref=tags/...' non trovato nel file."
-
-        # Sostituisce il gruppo 2 (vecchia versione) con new_version
-        # \1 è la prima parte (source = "...tags/), \3 è la virgoletta finale
-        new_content = re.sub(pattern, fr'\g<1>{new_version}\g<3>', content)
-        
-        # Aggiunge newline finale se manca (best practice)
-        if not new_content.endswith('\n'):
-            new_content += '\n'
+        ok, new_content = set_tf_version(content, new_version)
+        if not ok: return False, new_content
 
         with open(file_path, 'w') as f:
             f.write(new_content)
@@ -1,4 +1,84 @@
+import html
+import pandas as pd
 import streamlit as st
+from config import PRIORITY_ORDER
+
+def icon(char):
+    return f'<span class="no-select">{char}</span>'
+
+def format_info_cell(tag=None, chart_version=None, tf_version=None, label=None):
+    """HTML di una cella della matrice a partire dai campi strutturati (label: nome del campo estratto)."""
+    parts = []
+    if pd.notna(tag) and tag:
+        prefix = f"{html.escape(str(label))}: " if pd.notna(label) and label else ""
+        parts.append(f"{icon('🐬 ')}{prefix}{html.escape(str(tag))}")
+    if pd.notna(chart_version) and chart_version: parts.append(f"{icon('☸️ ')}{html.escape(str(chart_version))}")
+    if pd.notna(tf_version) and tf_version: parts.append(f"{icon('🏗️ TF: ')}{html.escape(str(tf_version))}")
+    return "<br>".join(parts)
+
+def build_info_column(df):
+    """Colonna Info (HTML) calcolata solo al momento del render."""
+    labels = df['Label'] if 'Label' in df.columns else [None] * len(df)  # snapshot precedenti senza Label
+    return [format_info_cell(t, c, v, l) for t, c, v, l in zip(df['Tag'], df['ChartVersion'], df['TfVersion'], labels)]
+
+def build_matrix_html(d, failed_repos=(), matched_cells=frozenset(), schema_cells=frozenset()):
+    """
+    Tabella HTML progetti x ambienti a partire dal modello dati strutturato.
+    matched_cells: celle (cloud, progetto, ambiente) da evidenziare (ricerca versioni).
+    schema_cells: celle con chiavi valuesInline non presenti nel values.yaml del chart.
+    """
+    # A. Recupera errori Pull (Triangolo)
+    proj_with_errors = []
+    if 'RepoFolder' in d.columns:
+        proj_with_errors = set(d.loc[d['RepoFolder'].isin(failed_repos), 'Progetto'])
+
+    # B. Recupera modifiche locali (Matita)
+    proj_dirty_map = {}
+    if 'IsChange' in d.columns:
+        dirty_rows = d[d['IsChange']]
+        if not dirty_rows.empty:
+            # Mappa Progetto -> Lista Ambienti
+            proj_dirty_map = dirty_rows.groupby('Progetto', observed=True)['Ambiente'].apply(lambda x: list(set(x))).to_dict()
+    
+    # C. Pivot Tabella (l'HTML delle celle nasce qui, non nel loader)
+    g = d[['Cloud', 'Progetto', 'Ambiente']].astype(str).assign(Info=build_info_column(d))
+    g['Match'] = [k in matched_cells for k in zip(g['Cloud'], g['Progetto'], g['Ambiente'])]
+    g['Schema'] = [k in schema_cells for k in zip(g['Cloud'], g['Progetto'], g['Ambiente'])]
+    g = g.groupby(['Progetto', 'Ambiente'], as_index=False).agg({
+        'Info': lambda x: '<br>'.join([val for val in x if val]),
+        'Match': 'any',
+        'Schema': 'any',
+    })
+    schema_badge = '<span style="cursor:help;" title="Chiavi valuesInline non presenti nel chart">🧩 </span>'
+    g['Info'] = [f'<div class="inner-cell{" cell-match" if hit else ""}">{schema_badge if bad else ""}{info}</div>'
+                 for info, hit, bad in zip(g['Info'], g['Match'], g['Schema'])]
+    
+    m = g.pivot(index="Progetto", columns="Ambiente", values="Info")
+    m.columns.name = None 
+    
+    cols = [c for c in PRIORITY_ORDER if c in m.columns] + sorted([c for c in m.columns if c not in PRIORITY_ORDER])
+    m = m.reindex(columns=cols).fillna("") 
+    
+    m_reset = m.reset_index()
+    
+    # D. Formattazione Colonna Progetto con Icone
+    def format_project_cell(name):
+        icons = ""
+        
+        # Icona Errore Pull
+        if name in proj_with_errors:
+            icons += '<span style="color:orange; cursor:help; margin-right:5px;" title="Git pull fallito">⚠️</span>'
+        
+        # Icona Modifiche Locali
+        if name in proj_dirty_map:
+            icons += f'<span style="cursor:help; margin-right:5px;" title="Modifiche non committate/pushate">✏️</span>'
+        
+        return f'<div class="inner-cell" style="font-weight:bold;">{icons}{name}</div>'
+    
+    m_reset["Progetto"] = m_reset["Progetto"].apply(format_project_cell)
+    
+    html_table = m_reset.to_html(classes="cdc-table", index=False, escape=False, border=0)
+    return f'<div class="cdc-table-container">{html_table}</div>'
 
 def inject_table_css():
     # Definiamo i colori
@@ -86,6 +166,12 @@ def inject_table_css():
         }}
 
 
+        /* Celle trovate dalla ricerca versioni */
+        .inner-cell.cell-match {{
+            background-color: rgba(255, 193, 7, 0.25);
+            box-shadow: inset 0 0 0 1px #ffc107;
+        }}
+
         /* Scrollbar styling (sottile per non disturbare) */
         .inner-cell::-webkit-scrollbar {{ height: 0px; }}
 
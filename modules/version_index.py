@@ -0,0 +1,158 @@
+import os
+import re
+import threading
+import pandas as pd
+
+# Colonne del modello dati indicizzate -> etichetta mostrata nei risultati
+INDEXED_FIELDS = {"Tag": "Tag", "ChartVersion": "Chart", "TfVersion": "TF"}
+
+_VERSION_RE = re.compile(r'^v?(\d+)(?:\.(\d+))?(?:\.(\d+))?')
+_WILDCARD_RE = re.compile(r'^v?(\d+)(?:\.(\d+))?\.[xX*]$')
+_COMPARATOR_RE = re.compile(r'^(>=|<=|>|<|=|\^|~)\s*(.+)$')
+
+def parse_version(value):
+    """'v1.4.2-rc1' -> (1, 4, 2). None se il valore non inizia con una versione."""
+    match = _VERSION_RE.match(str(value).strip())
+    if not match: return None
+    return tuple(int(g) if g else 0 for g in match.groups())
+
+def _source_file(row, field):
+    """File (relativo a ROOT_DIR) da cui proviene il valore di una cella."""
+    if field == "TfVersion" and row['FilePath']:
+        # FilePath è assoluto: si tiene la parte da RepoFolder in poi
+        parts = os.path.normpath(row['FilePath']).split(os.sep)
+        if row['RepoFolder'] in parts:
+            start = len(parts) - 1 - parts[::-1].index(row['RepoFolder'])
+            return os.path.join(*parts[start:])
+        return row['FilePath']
+    kind = "base" if field == "ChartVersion" or row['Virtual'] else "overlays"
+    return os.path.join(row['RepoFolder'], row['Ambiente'], kind, "kustomization.yaml")
+
+def _repo_entries(group):
+    entries = []
+    for row in group.to_dict('records'):
+        for field, label in INDEXED_FIELDS.items():
+            value = row[field]
+            if not isinstance(value, str) or not value: continue
+            # Progetti virtuali con più regole: il campo è la label della regola
+            if field == "Tag" and isinstance(row.get('Label'), str) and row['Label']: label = row['Label']
+            entries.append((value, {
+                "Progetto": row['Progetto'], "Ambiente": row['Ambiente'], "BaseEnv": row['BaseEnv'],
+                "Cloud": row['Cloud'], "RepoFolder": row['RepoFolder'],
+                "Campo": label, "Valore": value, "File": _source_file(row, field),
+            }))
+    return entries
+
+def _parse_range(query):
+    """
+    Traduce una query semver in lista di vincoli (operatore, versione).
+    Supporta: '0.9.x', '1.*', '^1.2.0', '~1.2.0', '>=1.2 <2.0' (anche separati da virgola).
+    """
+    wildcard = _WILDCARD_RE.match(query)
+    if wildcard:
+        major, minor = int(wildcard.group(1)), wildcard.group(2)
+        if minor is None: return [(">=", (major, 0, 0)), ("<", (major + 1, 0, 0))]
+        return [(">=", (major, int(minor), 0)), ("<", (major, int(minor) + 1, 0))]
+
+    constraints = []
+    for token in re.split(r'[\s,]+', query.strip()):
+        if not token: continue
+        match = _COMPARATOR_RE.match(token)
+        if not match: return None
+        op, ver = match.group(1), parse_version(match.group(2))
+        if ver is None: return None
+        # Componenti scritte: '~1' e '^0' fissano solo la major
+        major_only = _VERSION_RE.match(match.group(2).strip()).group(2) is None
+        if op == "^":
+            upper = (ver[0] + 1, 0, 0) if ver[0] > 0 or major_only else (0, ver[1] + 1, 0)
+            constraints += [(">=", ver), ("<", upper)]
+        elif op == "~":
+            upper = (ver[0] + 1, 0, 0) if major_only else (ver[0], ver[1] + 1, 0)
+            constraints += [(">=", ver), ("<", upper)]
+        else:
+            constraints.append((op, ver))
+    return constraints or None
+
+def _satisfies(version, constraints):
+    checks = {
+        ">=": lambda a, b: a >= b, "<=": lambda a, b: a <= b,
+        ">": lambda a, b: a > b, "<": lambda a, b: a < b, "=": lambda a, b: a == b,
+    }
+    return all(checks[op](version, ver) for op, ver in constraints)
+
+class VersionIndex:
+    """
+    Indice invertito valore di versione -> celle della matrice (progetto, env, repo, file).
+    Aggiornato in modo incrementale: si ricalcolano solo i repo le cui righe sono cambiate.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._repo_signatures = {}  # repo -> firma delle righe indicizzate
+        self._repo_entries = {}     # repo -> [(valore, entry)]
+        self._index = {}            # valore -> [entry]
+        self._versions = {}         # valore -> tupla semver (o None)
+        self._last_df = None
+
+    def _remove_repo(self, repo):
+        for value, entry in self._repo_entries.pop(repo, []):
+            remaining = [e for e in self._index.get(value, []) if e is not entry]
+            if remaining: self._index[value] = remaining
+            else:
+                self._index.pop(value, None)
+                self._versions.pop(value, None)
+        self._repo_signatures.pop(repo, None)
+
+    def update(self, df):
+        with self._lock:
+            if df is self._last_df: return
+            self._last_df = df
+            seen = set()
+            if not df.empty:
+                cols = ["Progetto", "Ambiente", "Virtual", "FilePath"] + [c for c in ("Label",) if c in df.columns] + list(INDEXED_FIELDS)
+                for repo, group in df.groupby('RepoFolder', observed=True):
+                    seen.add(repo)
+                    signature = tuple(
+                        tuple(None if not isinstance(v, str) and pd.isna(v) else v for v in rec)
+                        for rec in group[cols].itertuples(index=False, name=None)
+                    )
+                    if self._repo_signatures.get(repo) == signature: continue
+                    self._remove_repo(repo)
+                    entries = _repo_entries(group)
+                    for value, entry in entries:
+                        self._index.setdefault(value, []).append(entry)
+                        if value not in self._versions: self._versions[value] = parse_version(value)
+                    self._repo_entries[repo] = entries
+                    self._repo_signatures[repo] = signature
+            for repo in [r for r in self._repo_entries if r not in seen]:
+                self._remove_repo(repo)
+
+    def search(self, query):
+        """
+        Query esatta ('1.4.2'), per prefisso ('1.4*') o range semver ('0.9.x', '^1.2', '>=1.0 <2.0').
+        Restituisce la lista delle entry corrispondenti.
+        """
+        query = (query or "").strip()
+        if not query: return []
+        with self._lock:
+            if query.endswith("*") and not _WILDCARD_RE.match(query):
+                prefix = query[:-1]
+                values = [v for v in self._index if v.startswith(prefix)]
+            else:
+                constraints = _parse_range(query) if (_WILDCARD_RE.match(query) or _COMPARATOR_RE.match(query)) else None
+                if constraints:
+                    values = [v for v, ver in self._versions.items() if ver is not None and _satisfies(ver, constraints)]
+                else:
+                    values = [query] if query in self._index else []
+            # Ordine semver (1.10.0 dopo 1.9.0), i valori non di versione in fondo
+            ordered = sorted(values, key=lambda v: (self._versions[v] is None, self._versions[v] or (), v))
+            return [entry for v in ordered for entry in self._index[v]]
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+def get_version_index(root_dir, df):
+    """Indice condiviso per ROOT_DIR, allineato all'ultima scansione."""
+    with _INDEXES_LOCK:
+        index = _INDEXES.setdefault(root_dir, VersionIndex())
+    index.update(df)
+    return index
@@ -1,9 +1,39 @@
 import os
+import re
+import threading
+from functools import lru_cache
 from ruamel.yaml import YAML
+from config import CHART_CACHE_DIR
 
-yaml = YAML()
-yaml.preserve_quotes = True
-yaml.indent(mapping=2, sequence=4, offset=2)
+def _new_yaml():
+    y = YAML()
+    y.preserve_quotes = True
+    y.indent(mapping=2, sequence=4, offset=2)
+    return y
+
+yaml = _new_yaml()
+
+_parsed_cache = {}  # filepath -> ((mtime_ns, size), documento)
+_parsed_cache_lock = threading.Lock()
+
+def load_yaml_cached(filepath):
+    """
+    Parse di un file YAML con cache su (mtime, size): scansione, indici e diff
+    riusano lo stesso documento finché il file non cambia.
+    ATTENZIONE: il documento è condiviso, non va modificato (usare copy.deepcopy).
+    """
+    try: stat = os.stat(filepath)
+    except OSError: return None
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _parsed_cache_lock:
+        hit = _parsed_cache.get(filepath)
+    if hit and hit[0] == key: return hit[1]
+    # Istanza dedicata: l'oggetto YAML di ruamel non è thread-safe
+    with open(filepath, 'r') as f:
+        data = _new_yaml().load(f)
+    with _parsed_cache_lock:
+        _parsed_cache[filepath] = (key, data)
+    return data
 
 def is_valid_yaml(content):
     """Verifica se la stringa è un YAML valido."""
@@ -13,44 +43,72 @@ def is_valid_yaml(content):
     except Exception as e:
         return False, str(e)
 
-def traverse_dot_path(data, dot_path):
+# --- REGOLE DI ESTRAZIONE (progetti virtuali) ---
+# Sintassi di un campo: 'a.b[0].c' (indice lista), 'images[*].newTag' (wildcard),
+# 'copyTool.imageTag | copyTool.tag' (fallback in ordine). Un percorso non trovato
+# alla radice viene cercato anche in helmCharts[*].valuesInline.
+_RULE_TOKEN_RE = re.compile(r'([^.\[\]]+)|\[(\d+|\*)\]')
+_VALUES_INLINE_STEPS = (("key", "helmCharts"), ("wild", None), ("key", "valuesInline"))
+
+@lru_cache(maxsize=512)
+def compile_rule(expr):
+    """'a.b[0] | c[*].d' -> tupla di alternative, ognuna tupla di step ('key'|'index'|'wild', arg)."""
+    alternatives = []
+    for alt in expr.split("|"):
+        steps = []
+        for key, idx in _RULE_TOKEN_RE.findall(alt.strip()):
+            if key: steps.append(("key", key.strip()))
+            elif idx == "*": steps.append(("wild", None))
+            else: steps.append(("index", int(idx)))
+        if steps:
+            alternatives.append(tuple(steps))
+            alternatives.append(_VALUES_INLINE_STEPS + tuple(steps))
+    return tuple(alternatives)
+
+def _eval_steps(node, steps):
+    """Primo valore scalare raggiungibile seguendo gli step (i wildcard provano tutti gli elementi)."""
+    if not steps:
+        return None if node is None or isinstance(node, (dict, list)) else str(node)
+    kind, arg = steps[0]
+    if kind == "key":
+        return _eval_steps(node[arg], steps[1:]) if isinstance(node, dict) and arg in node else None
+    if kind == "index":
+        return _eval_steps(node[arg], steps[1:]) if isinstance(node, list) and -len(node) <= arg < len(node) else None
+    children = node.values() if isinstance(node, dict) else node if isinstance(node, list) else []
+    for child in children:
+        val = _eval_steps(child, steps[1:])
+        if val: return val
+    return None
+
+def evaluate_rules(filepath, rules):
     """
-    Funzione helper che naviga un dizionario usando la notazione 'a.b.c'.
-    Restituisce il valore o None se non esiste.
+    Valuta più regole sullo stesso file con un unico parse.
+    rules: lista di (label, espressione). Returns: {label: valore o None}
     """
-    keys = dot_path.split('.')
-    current = data
-    for k in keys:
-        if isinstance(current, dict) and k in current:
-            current = current[k]
-        else:
-            return None
-    return str(current)
-
-def get_yaml_value_by_path(filepath, dot_path):
+    results = {label: None for label, _ in rules}
+    try: data = load_yaml_cached(filepath)
+    except Exception: return results
+    if data is None: return results
+    for label, expr in rules:
+        for steps in compile_rule(expr):
+            val = _eval_steps(data, steps)
+            if val:
+                results[label] = val
+                break
+    return results
+
+def parse_rule_fields(spec):
     """
-    Legge un valore da un file YAML.
-    È SMART: Se non trova il valore alla radice, cerca dentro helmCharts -> valuesInline.
+    Campi della clausola WITH di progetti.txt: 'tag=copyTool.imageTag|copyTool.tag, copyTool.image'
+    -> [{"label": "tag", "path": "copyTool.imageTag|copyTool.tag"}, {"label": "", "path": "copyTool.image"}]
     """
-    if not os.path.exists(filepath): return None
-    try:
-        with open(filepath, 'r') as f:
-            data = yaml.load(f)
-        
-        # 1. Tentativo Diretto (es. se fosse alla root)
-        val = traverse_dot_path(data, dot_path)
-        if val: return val
-
-        # 2. Tentativo "Kustomize Helm": Cerca dentro helmCharts[].valuesInline
-        if 'helmCharts' in data and isinstance(data['helmCharts'], list):
-            for chart in data['helmCharts']:
-                if 'valuesInline' in chart:
-                    # Usa valuesInline come nuova radice e cerca lì
-                    val = traverse_dot_path(chart['valuesInline'], dot_path)
-                    if val: return val
-                    
-        return None
-    except: return None
+    fields = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part: continue
+        label, _, path = part.rpartition("=") if "=" in part else ("", "", part)
+        fields.append({"label": label.strip(), "path": path.strip()})
+    return fields
 
 def read_kustomize_values(root_dir, project, env):
     """
@@ -71,33 +129,31 @@ def read_kustomize_values(root_dir, project, env):
     # 1. Overlay (Image Tag)
     if os.path.exists(overlay_path):
         try:
-            with open(overlay_path, 'r') as f:
-                data = yaml.load(f)
-                if data and 'images' in data and len(data['images']) > 0:
-                    tag_val = data['images'][0].get('newTag', 'N/A')
+            data = load_yaml_cached(overlay_path)
+            if data and 'images' in data and len(data['images']) > 0:
+                tag_val = data['images'][0].get('newTag', 'N/A')
         except: pass
 
     # 2. Base (Helm Version + valuesInline scan)
     if os.path.exists(base_file_path):
         try:
-            with open(base_file_path, 'r') as f:
-                data = yaml.load(f)
+            data = load_yaml_cached(base_file_path)
+            
+            # Helm Version
+            if data and 'helmCharts' in data and len(data['helmCharts']) > 0:
+                chart = data['helmCharts'][0]
+                chart_val = chart.get('version', 'N/A')
                 
-                # Helm Version
-                if data and 'helmCharts' in data and len(data['helmCharts']) > 0:
-                    chart = data['helmCharts'][0]
-                    chart_val = chart.get('version', 'N/A')
-                    
-                    # --- SCANSIONE AUTOMATICA PER COPYTOOL ---
-                    # Se c'è valuesInline.copyTool.imageTag lo prendiamo come info extra
-                    if 'valuesInline' in chart:
-                        vi = chart['valuesInline']
-                        if 'copyTool' in vi:
-                            ct = vi['copyTool']
-                            # Cerca imageTag o tag
-                            ct_ver = ct.get('imageTag') or ct.get('tag')
-                            if ct_ver:
-                                extra_val = f"CopyTool: {ct_ver}"
+                # --- SCANSIONE AUTOMATICA PER COPYTOOL ---
+                # Se c'è valuesInline.copyTool.imageTag lo prendiamo come info extra
+                if 'valuesInline' in chart:
+                    vi = chart['valuesInline']
+                    if 'copyTool' in vi:
+                        ct = vi['copyTool']
+                        # Cerca imageTag o tag
+                        ct_ver = ct.get('imageTag') or ct.get('tag')
+                        if ct_ver:
+                            extra_val = f"CopyTool: {ct_ver}"
 
         except: pass
 
@@ -122,12 +178,29 @@ def save_file_content(filepath, content):
     except Exception as e:
         return False, f"Errore salvataggio: {str(e)}"
 
-def get_chart_values_content(root_dir, project):
-    chart_repo = f"{project}-chart"
-    path1 = os.path.join(root_dir, chart_repo, "values.yaml")
-    if os.path.exists(path1): return get_file_content(path1), path1
-    path2 = os.path.join(root_dir, chart_repo, project, "values.yaml")
-    if os.path.exists(path2): return get_file_content(path2), path2
+def _chart_yaml_version(chart_dir):
+    try: data = load_yaml_cached(os.path.join(chart_dir, "Chart.yaml"))
+    except Exception: return None
+    return str(data.get('version')) if isinstance(data, dict) and data.get('version') is not None else None
+
+def chart_values_file(root_dir, project, chart_version=None):
+    """
+    values.yaml del chart. Con chart_version: quello scaricato per quella versione (fetch_chart_values)
+    oppure un clone/cache HEAD il cui Chart.yaml dichiara la stessa versione, altrimenti None:
+    mai il values.yaml di un'altra versione. Senza chart_version: clone locale, poi cache HEAD.
+    """
+    if chart_version:
+        exact = os.path.join(CHART_CACHE_DIR, project, chart_version, "values.yaml")
+        if os.path.exists(exact): return exact
+    for chart_dir in (os.path.join(root_dir, f"{project}-chart"), os.path.join(root_dir, f"{project}-chart", project),
+                      os.path.join(CHART_CACHE_DIR, project, "HEAD")):
+        values = os.path.join(chart_dir, "values.yaml")
+        if os.path.exists(values) and (not chart_version or _chart_yaml_version(chart_dir) == chart_version): return values
+    return None
+
+def get_chart_values_content(root_dir, project, chart_version=None):
+    path = chart_values_file(root_dir, project, chart_version)
+    if path: return get_file_content(path), path
     return None, f"Values non trovato"
 
 def generate_completions_from_yaml(yaml_content):
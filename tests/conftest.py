@@ -0,0 +1,5 @@
+import os
+import sys
+
+# I test importano 'modules' e 'config' dalla root dell'app, come main.py: funziona anche con 'pytest' semplice
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,43 @@
+from modules.chart_validator import build_key_index, unknown_keys
+
+VALUES = """
+replicaCount: 1
+image:
+  repository: adapter
+  tag: ""
+podAnnotations: {}
+env:
+  - name: A
+    value: b
+"""
+
+def test_build_key_index():
+    paths, open_maps = build_key_index(VALUES)
+    assert ("image", "tag") in paths
+    assert ("env", "name") in paths
+    assert open_maps == {("podAnnotations",)}
+    assert build_key_index("a: [") is None
+
+def test_unknown_keys():
+    index = build_key_index(VALUES)
+    values_inline = {"replicaCount": 2, "image": {"tag": "1.0", "pullPolicy": "Always"},
+                     "podAnnotations": {"any": {"thing": 1}}, "env": [{"name": "X", "valueFrom": {}}],
+                     "extra": {"nested": 1}}
+    assert unknown_keys(values_inline, index) == ["image.pullPolicy", "env.valueFrom", "extra"]
+
+def test_chart_values_file_matches_version(tmp_path, monkeypatch):
+    from modules import yaml_manager
+    monkeypatch.setattr(yaml_manager, "CHART_CACHE_DIR", str(tmp_path / "cache"))
+    clone = tmp_path / "root" / "adapter-chart"
+    clone.mkdir(parents=True)
+    (clone / "values.yaml").write_text(VALUES)
+    (clone / "Chart.yaml").write_text("version: 1.1.0\n")
+    root = str(tmp_path / "root")
+    assert yaml_manager.chart_values_file(root, "adapter") == str(clone / "values.yaml")
+    assert yaml_manager.chart_values_file(root, "adapter", "1.1.0") == str(clone / "values.yaml")
+    assert yaml_manager.chart_values_file(root, "adapter", "1.0.0") is None
+
+    exact = tmp_path / "cache" / "adapter" / "1.0.0"
+    exact.mkdir(parents=True)
+    (exact / "values.yaml").write_text(VALUES)
+    assert yaml_manager.chart_values_file(root, "adapter", "1.0.0") == str(exact / "values.yaml")
@@ -0,0 +1,38 @@
+import json
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from modules import ecr_manager
+
+MANIFEST = json.dumps({"schemaVersion": 2, "mediaType": "application/vnd.docker.distribution.manifest.v2+json",
+                       "config": {"digest": "sha256:" + "a" * 64, "size": 1, "mediaType": "application/vnd.docker.container.image.v1+json"},
+                       "layers": []})
+
+@pytest.fixture
+def ecr():
+    with moto.mock_aws():
+        client = boto3.client("ecr", region_name="eu-central-1")
+        client.create_repository(repositoryName="tgk-cdc/adapter")
+        client.put_image(repositoryName="tgk-cdc/adapter", imageManifest=MANIFEST, imageTag="1.2.0")
+        ecr_manager._tag_cache.clear()
+        yield client
+
+def test_check_image_tags_exist(ecr):
+    refs = ecr_manager.image_refs_from_overlay(
+        "images:\n"
+        "  - name: adapter\n    newTag: 1.2.0\n"
+        "  - name: adapter-sidecar\n    newName: tgk-cdc/adapter\n    newTag: 9.9.9\n"
+        "  - name: nginx\n    newTag: 1.25\n", "adapter-kustomization")
+    assert sorted(refs) == [("tgk-cdc/adapter", "1.2.0"), ("tgk-cdc/adapter", "9.9.9")]
+
+    results, error = ecr_manager.check_image_tags_exist(refs + [("tgk-cdc/missing", "1.0.0")], client=ecr)
+    assert error is None
+    assert results == {("tgk-cdc/adapter", "1.2.0"): True, ("tgk-cdc/adapter", "9.9.9"): False,
+                       ("tgk-cdc/missing", "1.0.0"): False}
+
+def test_image_refs_from_non_mapping_overlay():
+    assert ecr_manager.image_refs_from_overlay("- name: adapter\n", "adapter-kustomization") == []
+    assert ecr_manager.image_refs_from_overlay("just a string", "adapter-kustomization") == []
+    assert ecr_manager.image_refs_from_overlay("images: [adapter]\n", "adapter-kustomization") == []
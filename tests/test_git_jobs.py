@@ -0,0 +1,47 @@
+import time
+import threading
+
+from modules.git_jobs import GitJobQueue
+
+def _wait(queue, job_ids, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        jobs = [queue.get(i) for i in job_ids]
+        if all(j["status"] in ("done", "failed") for j in jobs): return jobs
+        time.sleep(0.01)
+    raise AssertionError("job non conclusi")
+
+def test_jobs_on_same_repo_are_serial(tmp_path):
+    queue, running, overlaps, order = GitJobQueue(max_workers=4), [], [], []
+    def job(n):
+        running.append(n)
+        if len(running) > 1: overlaps.append(n)
+        time.sleep(0.02)
+        order.append(n)
+        running.remove(n)
+        return True, f"job {n}"
+    ids = [queue.submit(str(tmp_path), f"job {n}", job, n) for n in range(4)]
+    jobs = _wait(queue, ids)
+    assert order == [0, 1, 2, 3]
+    assert overlaps == []
+    assert [j["message"] for j in jobs] == [f"job {n}" for n in range(4)]
+    assert queue.active() == []
+
+def test_jobs_on_different_repos_run_in_parallel(tmp_path):
+    queue, barrier = GitJobQueue(max_workers=4), threading.Barrier(2, timeout=5)
+    def job():
+        barrier.wait()  # passa solo se i due job girano insieme
+        return True, "ok"
+    ids = [queue.submit(str(tmp_path / name), name, job) for name in ("a", "b")]
+    assert [j["ok"] for j in _wait(queue, ids)] == [True, True]
+
+def test_failed_job_and_callback(tmp_path):
+    queue, done = GitJobQueue(), []
+    def boom(): raise RuntimeError("push rifiutato")
+    job_id = queue.submit(str(tmp_path), "push", boom, on_done=done.append)
+    job, = _wait(queue, [job_id])
+    assert (job["status"], job["ok"], job["message"]) == ("failed", False, "push rifiutato")
+    deadline = time.time() + 5
+    while not done and time.time() < deadline: time.sleep(0.01)
+    assert done[0]["id"] == job_id
+    assert queue.history()[0]["id"] == job_id
@@ -0,0 +1,32 @@
+from modules.promotion import apply_promotion_plan
+
+OVERLAY = "images:\n  - name: adapter\n    newTag: 1.0.0  # tag\n"
+MAIN_TF = 'module "m" {\n  source = "git::ssh://example/m.git?ref=tags/v1.0.0"\n}\n'
+
+def _files(tmp_path):
+    overlay, main_tf = tmp_path / "kustomization.yaml", tmp_path / "main.tf"
+    overlay.write_text(OVERLAY)
+    main_tf.write_text(MAIN_TF)
+    return overlay, main_tf
+
+def test_apply_promotion_plan(tmp_path):
+    overlay, main_tf = _files(tmp_path)
+    ok, _, changed = apply_promotion_plan([
+        {"Kind": "Tag", "File": str(overlay), "Path": ("images", ("name", "adapter"), "newTag"), "A": "1.1.0"},
+        {"Kind": "TF", "File": str(main_tf), "Path": None, "A": "v1.2.0"},
+    ])
+    assert ok
+    assert sorted(changed) == sorted([str(overlay), str(main_tf)])
+    assert overlay.read_text() == "images:\n  - name: adapter\n    newTag: 1.1.0  # tag\n"
+    assert "?ref=tags/v1.2.0" in main_tf.read_text()
+
+def test_apply_promotion_plan_writes_nothing_on_failure(tmp_path):
+    overlay, main_tf = _files(tmp_path)
+    main_tf.write_text('module "m" {\n  source = "./local"\n}\n')
+    ok, msg, changed = apply_promotion_plan([
+        {"Kind": "Tag", "File": str(overlay), "Path": ("images", ("name", "adapter"), "newTag"), "A": "1.1.0"},
+        {"Kind": "TF", "File": str(main_tf), "Path": None, "A": "v1.2.0"},
+    ])
+    assert not ok and changed == []
+    assert str(main_tf) in msg
+    assert overlay.read_text() == OVERLAY
@@ -0,0 +1,78 @@
+import threading
+import pytest
+
+from modules.shared_cache import SharedCache
+
+class _Rerun(BaseException):
+    """Come RerunException di Streamlit: non è un Exception."""
+
+def _start_followers(cache, key, count, results):
+    def follow():
+        try: results.append(cache.get_or_compute(key, lambda: "follower"))
+        except Exception as e: results.append(e)
+    threads = [threading.Thread(target=follow) for _ in range(count)]
+    for t in threads: t.start()
+    return threads
+
+def _wait_inflight(cache, key):
+    while not cache.is_inflight(key): pass
+
+def test_single_flight():
+    cache, started, release, calls, results = SharedCache(), threading.Event(), threading.Event(), [], []
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return "leader"
+    leader = threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+    leader.start()
+    started.wait()
+    followers = _start_followers(cache, "k", 3, results)
+    release.set()
+    for t in [leader] + followers: t.join(5)
+    assert calls == [1]
+    assert results == ["leader"] * 4
+    assert cache.get("k") == "leader"
+
+def test_leader_error_reaches_followers():
+    cache, started, release, results = SharedCache(), threading.Event(), threading.Event(), []
+    def compute():
+        started.set()
+        release.wait()
+        raise RuntimeError("scan fallita")
+    leader = threading.Thread(target=lambda: pytest.raises(RuntimeError, cache.get_or_compute, "k", compute))
+    leader.start()
+    started.wait()
+    followers = _start_followers(cache, "k", 2, results)
+    release.set()
+    for t in [leader] + followers: t.join(5)
+    assert [str(r) for r in results] == ["scan fallita"] * 2
+    assert cache.get("k") is None
+
+def test_aborted_leader_followers_recompute():
+    cache, started, release, results = SharedCache(), threading.Event(), threading.Event(), []
+    def compute():
+        started.set()
+        release.wait()
+        raise _Rerun()
+    def lead():
+        with pytest.raises(_Rerun): cache.get_or_compute("k", compute)
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait()
+    followers = _start_followers(cache, "k", 3, results)
+    _wait_inflight(cache, "k")
+    release.set()
+    for t in [leader] + followers: t.join(5)
+    # Nessun None silenzioso: un follower ricalcola, gli altri ne condividono il risultato
+    assert results == ["follower"] * 3
+    assert cache.get("k") == "follower"
+
+def test_invalidate_during_compute_discards_result():
+    cache = SharedCache()
+    def compute():
+        cache.invalidate("k")
+        return "vecchio"
+    assert cache.get_or_compute("k", compute) == "vecchio"
+    assert cache.get("k") is None
+    assert cache.generation == 1
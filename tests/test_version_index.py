@@ -0,0 +1,54 @@
+from modules.data_loader import _to_frame
+from modules.version_index import VersionIndex, _parse_range
+
+def _row(project, env, tag, chart=None, repo=None):
+    return {"Progetto": project, "Ambiente": env, "BaseEnv": env, "Cloud": "aws", "Tipo": "Kustomize",
+            "Tag": tag, "ChartVersion": chart, "TfVersion": None, "Virtual": False, "Label": None,
+            "RepoFolder": repo or f"{project}-kustomization", "FilePath": None, "IsChange": False}
+
+def _tf_row(project, env, version, root="/srv/cdc"):
+    repo = f"{project}-config-aws"
+    return {**_row(project, env, None, repo=repo), "Tipo": "Terraform", "TfVersion": version,
+            "FilePath": f"{root}/{repo}/environments/{env}/main.tf"}
+
+def _index(rows):
+    index = VersionIndex()
+    index.update(_to_frame(rows))
+    return index
+
+def test_parse_range():
+    assert _parse_range("0.9.x") == [(">=", (0, 9, 0)), ("<", (0, 10, 0))]
+    assert _parse_range("1.*") == [(">=", (1, 0, 0)), ("<", (2, 0, 0))]
+    assert _parse_range("^1.2.0") == [(">=", (1, 2, 0)), ("<", (2, 0, 0))]
+    assert _parse_range("^0.3.1") == [(">=", (0, 3, 1)), ("<", (0, 4, 0))]
+    assert _parse_range("~1.2.3") == [(">=", (1, 2, 3)), ("<", (1, 3, 0))]
+    assert _parse_range("~1.2") == [(">=", (1, 2, 0)), ("<", (1, 3, 0))]
+    assert _parse_range("~1") == [(">=", (1, 0, 0)), ("<", (2, 0, 0))]
+    assert _parse_range("^0") == [(">=", (0, 0, 0)), ("<", (1, 0, 0))]
+    assert _parse_range(">=1.2, <2.0") == [(">=", (1, 2, 0)), ("<", (2, 0, 0))]
+    assert _parse_range(">=abc") is None
+
+def test_search():
+    index = _index([_row("adapter", "dev", "1.4.2", chart="0.9.1"), _row("adapter", "prod", "1.3.0", chart="0.9.1"),
+                    _row("gateway", "dev", "2.0.0")])
+    assert [(e["Progetto"], e["Ambiente"]) for e in index.search("1.4.2")] == [("adapter", "dev")]
+    assert {e["Valore"] for e in index.search("1.*")} == {"1.4.2", "1.3.0"}
+    assert [e["Campo"] for e in index.search("0.9.x")] == ["Chart", "Chart"]
+    assert [e["Valore"] for e in index.search(">=1.4 <3")] == ["1.4.2", "2.0.0"]
+    assert index.search("9.9.9") == []
+
+def test_incremental_update():
+    index = _index([_row("adapter", "dev", "1.4.2"), _row("gateway", "dev", "2.0.0")])
+    index.update(_to_frame([_row("adapter", "dev", "1.5.0")]))
+    assert index.search("1.4.2") == []
+    assert index.search("2.0.0") == []
+    assert [e["Progetto"] for e in index.search("1.5.0")] == ["adapter"]
+
+def test_search_sorted_by_version():
+    index = _index([_row("a", "dev", "1.10.0"), _row("b", "dev", "1.9.0"), _row("c", "dev", "1.2.0")])
+    assert [e["Valore"] for e in index.search("^1")] == ["1.2.0", "1.9.0", "1.10.0"]
+    assert [e["Valore"] for e in index.search("1.*")] == ["1.2.0", "1.9.0", "1.10.0"]
+
+def test_terraform_source_file_is_relative():
+    index = _index([_tf_row("adapter", "dev", "v3.1.0")])
+    assert index.search("v3.1.0")[0]["File"] == "adapter-config-aws/environments/dev/main.tf"
@@ -0,0 +1,23 @@
+from modules.yaml_manager import compile_rule, evaluate_rules, parse_rule_fields
+
+def test_compile_rule():
+    assert compile_rule("a.b[0] | c[*].d") == (
+        (("key", "a"), ("key", "b"), ("index", 0)),
+        (("key", "helmCharts"), ("wild", None), ("key", "valuesInline"), ("key", "a"), ("key", "b"), ("index", 0)),
+        (("key", "c"), ("wild", None), ("key", "d")),
+        (("key", "helmCharts"), ("wild", None), ("key", "valuesInline"), ("key", "c"), ("wild", None), ("key", "d")),
+    )
+
+def test_evaluate_rules(tmp_path):
+    path = tmp_path / "kustomization.yaml"
+    path.write_text(
+        "images:\n  - name: a\n  - name: b\n    newTag: 1.2.0\n"
+        "helmCharts:\n  - name: chart\n    valuesInline:\n      copyTool:\n        tag: 0.3.0\n")
+    rules = [("img", "images[*].newTag"), ("first", "images[0].newTag"), ("copy", "copyTool.imageTag | copyTool.tag"),
+             ("missing", "nope.x")]
+    assert evaluate_rules(str(path), rules) == {"img": "1.2.0", "first": None, "copy": "0.3.0", "missing": None}
+    assert evaluate_rules(str(tmp_path / "assente.yaml"), rules) == dict.fromkeys(["img", "first", "copy", "missing"])
+
+def test_parse_rule_fields():
+    assert parse_rule_fields("tag=copyTool.imageTag|copyTool.tag, copyTool.image") == [
+        {"label": "tag", "path": "copyTool.imageTag|copyTool.tag"}, {"label": "", "path": "copyTool.image"}]
@@ -0,0 +1,42 @@
+"""
+Rende indipendenti dall'object store condiviso tutti i repo di ROOT_DIR (git repack -a -d
++ rimozione di objects/info/alternates) e, con --remove-store, cancella lo store.
+Da eseguire dalla cartella dell'app prima di cancellare/spostare .cdc_config/object_cache.git:
+cancellare lo store senza questo passaggio lascia i clone senza gli oggetti presi in prestito.
+
+Uso:  python tools/dissociate_repos.py --root ../cdc [--remove-store]
+"""
+import os
+import sys
+import shutil
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import OBJECT_CACHE_DIR
+from modules.git_manager import dissociate_repo
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", required=True, help="ROOT_DIR con i repository")
+    parser.add_argument("--remove-store", action="store_true", help="cancella lo store se tutti i repo sono indipendenti")
+    args = parser.parse_args()
+
+    failed = []
+    for name in sorted(os.listdir(args.root)):
+        repo = os.path.join(args.root, name)
+        if not os.path.isdir(os.path.join(repo, ".git")): continue
+        ok, msg = dissociate_repo(repo)
+        print(f"{'✅' if ok else '❌'} {name}: {msg}")
+        if not ok: failed.append(name)
+
+    if args.remove_store and OBJECT_CACHE_DIR:
+        if failed:
+            print(f"Store NON rimosso: {len(failed)} repo dipendono ancora da {OBJECT_CACHE_DIR}")
+            sys.exit(1)
+        shutil.rmtree(OBJECT_CACHE_DIR, ignore_errors=True)
+        print(f"🗑️ Store rimosso: {OBJECT_CACHE_DIR}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Load test headless di main.py con streamlit.testing (AppTest).
+
+Crea un ROOT_DIR sintetico (repo kustomization + terraform, ognuno clonato da un
+remote git locale), poi misura la latenza del rerun completo dopo le interazioni
+tipiche: cambio Provider, Progetto, Ambiente e salvataggio di un overlay.
+Riporta p50/p95 e il picco di memoria (tracemalloc) per scenario, più il picco complessivo.
+
+Uso:  python tools/load_test.py --projects 40 --iterations 20
+Nota: il code_editor è un componente custom e non è pilotabile da AppTest; il
+salvataggio è simulato come fa il bottone Save (scrittura file + invalidazione cache).
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+ENVS = ["dev", "test", "prod", "prod-az"]
+
+OVERLAY_TMPL = """images:
+  - name: {proj}
+    newName: 123456789.dkr.ecr.eu-central-1.amazonaws.com/tgk-cdc/{proj}
+    newTag: {tag}
+"""
+BASE_TMPL = """helmCharts:
+  - name: {proj}
+    version: {chart}
+    valuesInline:
+      replicaCount: 2
+      copyTool:
+        imageTag: {tag}
+"""
+TF_TMPL = """module "{proj}" {{
+  source = "git::ssh://git@example.com/{proj}-module.git?ref=tags/{tag}"
+}}
+"""
+
+def _git(*args, cwd=None):
+    subprocess.run(["git", "-c", "user.name=load-test", "-c", "user.email=load-test@localhost", *args],
+                   cwd=cwd, check=True, capture_output=True)
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f: f.write(content)
+
+def _make_repo(root_dir, remotes_dir, name, files):
+    """Repo di lavoro in root_dir/name con upstream su un remote bare locale."""
+    seed = os.path.join(remotes_dir, f"{name}.seed")
+    for rel, content in files.items(): _write(os.path.join(seed, rel), content)
+    _git("init", "-q", "-b", "main", seed)
+    _git("add", "-A", cwd=seed)
+    _git("commit", "-q", "-m", "init", cwd=seed)
+    remote = os.path.join(remotes_dir, f"{name}.git")
+    _git("clone", "-q", "--bare", seed, remote)
+    shutil.rmtree(seed)
+    _git("clone", "-q", remote, os.path.join(root_dir, name))
+
+def build_workspace(base_dir, projects):
+    """ROOT_DIR sintetico: per ogni progetto un repo -kustomization e uno -config-aws."""
+    root_dir = os.path.join(base_dir, "cdc")
+    remotes_dir = os.path.join(base_dir, "remotes")
+    os.makedirs(root_dir)
+    os.makedirs(remotes_dir)
+    for i in range(projects):
+        proj = f"svc{i:03d}"
+        kust = {}
+        for j, env in enumerate(ENVS):
+            kust[f"{env}/overlays/kustomization.yaml"] = OVERLAY_TMPL.format(proj=proj, tag=f"1.{i % 7}.{j}")
+            kust[f"{env}/base/kustomization.yaml"] = BASE_TMPL.format(proj=proj, chart=f"0.{j}.{i % 5}", tag=f"2.{j}.0")
+        _make_repo(root_dir, remotes_dir, f"{proj}-kustomization", kust)
+        tf = {f"environments/{env}/main.tf": TF_TMPL.format(proj=proj, tag=f"v3.{j}.0")
+              for j, env in enumerate(ENVS[:-1])}
+        _make_repo(root_dir, remotes_dir, f"{proj}-config-aws", tf)
+    return root_dir
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def _widget(widgets, label):
+    return next(w for w in widgets if w.label == label)
+
+def _timed_run(at, samples, peaks, name, timeout):
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    at.run(timeout=timeout)
+    samples.setdefault(name, []).append(time.perf_counter() - start)
+    # Picco del singolo rerun (reset_peak lo azzera a ogni run): si tiene il massimo per scenario
+    peaks[name] = max(peaks.get(name, 0), tracemalloc.get_traced_memory()[1])
+    if at.exception: raise RuntimeError(f"{name}: {at.exception[0].value}")
+
+def run_load_test(root_dir, iterations, timeout):
+    from streamlit.testing.v1 import AppTest
+    from modules.shared_cache import get_shared_cache
+    from modules.yaml_manager import save_file_content
+
+    samples, peaks = {}, {}
+    tracemalloc.start()
+    at = AppTest.from_file(os.path.join(REPO_DIR, "main.py"), default_timeout=timeout)
+    at.session_state['root_dir'] = root_dir
+    _timed_run(at, samples, peaks, "avvio (cache fredda)", timeout)
+
+    providers = ["☁️ AWS", "🔷 Azure"]
+    for it in range(iterations):
+        _widget(at.sidebar.radio, "Provider").set_value(providers[(it + 1) % 2])
+        _timed_run(at, samples, peaks, "cambio Provider", timeout)
+
+        proj_box = _widget(at.sidebar.selectbox, "Progetto")
+        proj_box.set_value(proj_box.options[it % len(proj_box.options)])
+        _timed_run(at, samples, peaks, "cambio Progetto", timeout)
+
+        env_box = _widget(at.sidebar.selectbox, "Ambiente")
+        env_box.set_value(env_box.options[it % len(env_box.options)])
+        _timed_run(at, samples, peaks, "cambio Ambiente", timeout)
+
+        # Salvataggio overlay: stessa sequenza del bottone Save dell'editor, poi rerun con rescan
+        proj = _widget(at.sidebar.selectbox, "Progetto").value
+        overlay = os.path.join(root_dir, f"{proj}-kustomization", "dev", "overlays", "kustomization.yaml")
+        if os.path.exists(overlay):
+            save_file_content(overlay, OVERLAY_TMPL.format(proj=proj, tag=f"9.{it}.0"))
+            get_shared_cache().invalidate(f"scan:{root_dir}")
+            _timed_run(at, samples, peaks, "salvataggio editor", timeout)
+
+    tracemalloc.stop()
+    return samples, peaks
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=30, help="progetti sintetici (2 repo ciascuno)")
+    parser.add_argument("--iterations", type=int, default=10, help="ripetizioni di ogni interazione")
+    parser.add_argument("--timeout", type=float, default=120, help="timeout di un singolo rerun (s)")
+    parser.add_argument("--keep", action="store_true", help="non cancellare il workspace temporaneo")
+    args = parser.parse_args()
+
+    base_dir = tempfile.mkdtemp(prefix="cdc-load-test-")
+    # Settings, snapshot e repo_config isolati nel workspace temporaneo
+    os.environ["CDC_CONFIG_DIR"] = os.path.join(base_dir, ".cdc_config")
+    os.chdir(base_dir)
+    try:
+        print(f"Workspace: {base_dir} ({args.projects * 2} repo)")
+        root_dir = build_workspace(base_dir, args.projects)
+        samples, peaks = run_load_test(root_dir, args.iterations, args.timeout)
+
+        mib = lambda b: b / 1024 / 1024
+        print(f"\n{'Scenario':<24}{'n':>4}{'p50 (ms)':>12}{'p95 (ms)':>12}{'max (ms)':>12}{'picco (MiB)':>13}")
+        for name, values in samples.items():
+            ms = [v * 1000 for v in values]
+            print(f"{name:<24}{len(ms):>4}{statistics.median(ms):>12.1f}{_percentile(ms, 95):>12.1f}{max(ms):>12.1f}{mib(peaks[name]):>13.1f}")
+        print(f"\nPicco memoria complessivo (tracemalloc): {mib(max(peaks.values())):.1f} MiB")
+    finally:
+        if args.keep: print(f"Workspace conservato: {base_dir}")
+        else: shutil.rmtree(base_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Misura l'effetto dell'object store condiviso (--reference-if-able) sui clone.
+
+Crea un workspace sintetico di remote bare "fratelli" come in progetti.txt: per ogni
+area la coppia config-dev/config-prod e le varianti -az, tutte con la stessa storia di
+base e pochi commit propri. Poi clona tutto due volte (clone indipendenti / con store
+condiviso) e riporta tempo di clone e spazio su disco (.git + store).
+
+Uso:  python tools/object_store_bench.py --areas 6 --files 400 --commits 30
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+VARIANTS = ["config-dev", "config-prod", "config-dev-az", "config-prod-az"]
+
+def _git(*args, cwd=None):
+    subprocess.run(["git", "-c", "user.name=bench", "-c", "user.email=bench@localhost", *args],
+                   cwd=cwd, check=True, capture_output=True)
+
+def _commit_files(repo, prefix, count, seed):
+    for i in range(count):
+        path = os.path.join(repo, "environments", prefix, f"module{i:04d}.tf")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(f'module "m{i}" {{\n  source = "git::ssh://example/m{i}.git?ref=tags/v{seed}.{i}"\n}}\n' * 20)
+    _git("add", "-A", cwd=repo)
+    _git("commit", "-q", "-m", f"{prefix} {seed}", cwd=repo)
+
+def build_remotes(base_dir, areas, files, commits):
+    """Remote bare: storia comune per area (files x commits) + un commit specifico per variante."""
+    remotes = os.path.join(base_dir, "remotes")
+    urls = []
+    for a in range(areas):
+        seed = os.path.join(base_dir, f"area{a}.seed")
+        _git("init", "-q", "-b", "main", seed)
+        for c in range(commits):
+            _commit_files(seed, "shared", files // commits or 1, f"{a}{c}")
+        for variant in VARIANTS:
+            name = f"area{a}-{variant}"
+            work = os.path.join(base_dir, f"{name}.work")
+            _git("clone", "-q", seed, work)
+            _commit_files(work, variant, 5, variant)
+            bare = os.path.join(remotes, f"{name}.git")
+            _git("clone", "-q", "--bare", work, bare)
+            shutil.rmtree(work)
+            # file:// forza il trasporto pack, come un remote vero (niente hardlink locali)
+            urls.append(f"file://{bare}")
+        shutil.rmtree(seed)
+    return urls
+
+def _disk_usage(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try: total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError: pass
+    return total
+
+def _clone_all(urls, dest, use_cache):
+    import modules.git_manager as gm
+    gm.OBJECT_CACHE_DIR = os.path.join(dest, ".object_cache.git") if use_cache else None
+    workspace = os.path.join(dest, "cdc")
+    os.makedirs(workspace)
+    start = time.perf_counter()
+    for url in urls:
+        gm._clone_repo(url, os.path.basename(url).removesuffix(".git"), workspace)
+    elapsed = time.perf_counter() - start
+    git_dirs = sum(_disk_usage(os.path.join(workspace, r, ".git")) for r in os.listdir(workspace))
+    cache = _disk_usage(gm.OBJECT_CACHE_DIR) if use_cache else 0
+    return elapsed, git_dirs, cache
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--areas", type=int, default=4, help="aree funzionali (4 repo ciascuna)")
+    parser.add_argument("--files", type=int, default=300, help="file .tf nella storia comune di un'area")
+    parser.add_argument("--commits", type=int, default=20, help="commit nella storia comune di un'area")
+    args = parser.parse_args()
+
+    base_dir = tempfile.mkdtemp(prefix="cdc-object-store-")
+    try:
+        urls = build_remotes(base_dir, args.areas, args.files, args.commits)
+        print(f"{len(urls)} remote sintetici in {base_dir}\n")
+        print(f"{'Modalità':<22}{'clone (s)':>10}{'.git (MiB)':>12}{'store (MiB)':>13}{'totale (MiB)':>14}")
+        for label, use_cache in (("clone indipendenti", False), ("store condiviso", True)):
+            dest = os.path.join(base_dir, "cache" if use_cache else "plain")
+            elapsed, git_dirs, cache = _clone_all(urls, dest, use_cache)
+            mib = lambda b: b / 1024 / 1024
+            print(f"{label:<22}{elapsed:>10.2f}{mib(git_dirs):>12.1f}{mib(cache):>13.1f}{mib(git_dirs + cache):>14.1f}")
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()